@@ -98,7 +98,7 @@ const chat: ChatApi = {
 // --- Campaigns ---
 const campaigns: CampaignsApi = {
     getCampaigns: async () => {
-        const response = await apiClient.get('campaigns/');
+        const response = await apiClient.get('campaigns/', { params: { view: 'row' } });
         // Backend returns stats nested, frontend expects root.
         return response.data.map((c: any) => ({
             ...c,
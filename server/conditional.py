@@ -0,0 +1,87 @@
+from typing import Any, Awaitable, Callable, Iterable, Optional
+from fastapi import Request, Response, status
+from pydantic import TypeAdapter
+from cache import TTLCache
+from fastjson import dumps
+from singleflight import SingleFlight
+from invalidation import invalidation
+import hashlib
+import os
+import versions
+
+# Conditional GET for list endpoints.
+# The ETag of a response is a hash of its body, remembered per
+# (route, query string, scope, versions of the collections it reads). When a
+# poll arrives with a matching If-None-Match and none of those collections
+# has been written since, we answer 304 without touching Mongo or the
+# serializer. The TTL bounds how long a 304 can hide a write made by another
+# worker (which doesn't bump our counters).
+CONDITIONAL_TTL = float(os.getenv("CONDITIONAL_TTL", "30"))
+
+_etags = TTLCache(maxsize=int(os.getenv("CONDITIONAL_CACHE_SIZE", "2048")), ttl=CONDITIONAL_TTL)
+_bodies = TTLCache(maxsize=64, ttl=CONDITIONAL_TTL)
+
+# Once the change stream bumps versions for every writer, the TTL is only a safety net
+CONDITIONAL_LIVE_TTL = float(os.getenv("CONDITIONAL_LIVE_TTL", "600"))
+invalidation.extend_ttl(_etags, CONDITIONAL_LIVE_TTL)
+invalidation.extend_ttl(_bodies, CONDITIONAL_LIVE_TTL)
+
+# Concurrent misses for the same key (the 9:00 dashboard rush) share one
+# query + serialization. SINGLE_FLIGHT_MICROCACHE optionally keeps the result
+# a little longer (seconds) for requests that arrive just after it finished.
+_flights = SingleFlight(microcache=float(os.getenv("SINGLE_FLIGHT_MICROCACHE", "0")))
+
+def _cache_key(request: Request, collections: Iterable[str], scope: str) -> tuple:
+    return (
+        request.url.path,
+        str(request.query_params),
+        scope,
+        tuple((c, versions.current(c)) for c in collections),
+    )
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip() for tag in header.split(",")]
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+async def conditional_json(
+    request: Request,
+    collections: Iterable[str],
+    load: Callable[[], Awaitable[Any]],
+    adapter: Optional[TypeAdapter] = None,
+    scope: str = "",
+    cache_body: bool = False,
+) -> Response:
+    """
+    Serve `await load()` with ETag/304 handling. Models are serialized through
+    `adapter` (camelCase aliases, as FastAPI's response_model would); without
+    an adapter `load()` must return plain dicts, which go out through orjson.
+    `cache_body` also keeps the serialized body for small, hot lists.
+    `scope` must distinguish callers allowed to see different data, since
+    identical in-flight requests with the same scope share one result.
+    """
+    collections = tuple(collections)
+    key = _cache_key(request, collections, scope)
+
+    etag: Optional[str] = _etags.get(key)
+    if etag is not None and _matches(request, etag):
+        return _not_modified(etag)
+
+    body = _bodies.get(key) if cache_body else None
+    if body is None:
+        async def produce():
+            data = await load()
+            return adapter.dump_json(data, by_alias=True) if adapter is not None else dumps(data)
+        body = await _flights.do(key, produce)
+        if cache_body:
+            _bodies.set(key, body)
+    etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+    _etags.set(key, etag)
+
+    if _matches(request, etag):
+        return _not_modified(etag)
+    return Response(content=body, media_type="application/json", headers={"ETag": etag, "Cache-Control": "no-cache"})
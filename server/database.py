@@ -1,49 +1,197 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
-from models import User, Contact, Campaign, Message, Template, SheetImport
+from pymongo import monitoring
+from models import User, Contact, Campaign, Message, Template, SheetImport, SheetImportRow
+from db_profiles import bind_profiles
+from typing import Any, Dict, Optional
 import os
 from dotenv import load_dotenv
 import certifi # Kept for safety, but unused in the connection below
+import threading
+from metrics import Gauge
+from query_monitor import command_monitor
 import traceback
 
 load_dotenv()
 
+DOCUMENT_MODELS = [User, Contact, Campaign, Message, Template, SheetImport, SheetImportRow]
+
+# --- Connection Pool Settings ---
+# One client per process, shared by the app, the CLI tools and the verify
+# scripts. Size the pool for the expected number of concurrent queries per
+# worker; if requests start waiting on it, pool_stats() shows it.
+MONGO_DB = os.getenv("MONGO_DB", "whatsapp_dashboard")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "") # e.g. "zstd,zlib" (zstd needs the zstandard package)
+MONGO_READ_CONCERN = os.getenv("MONGO_READ_CONCERN", "") # e.g. "local", "majority"
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "") # e.g. "1", "majority"
+MONGO_TLS = os.getenv("MONGO_TLS", "true").lower() != "false" # false for a plain local mongod
+
+# --- Pool Metrics ---
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Connection checkouts, as seen by the driver.
+    Called from the driver's threads, hence the lock.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.open = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_use": self.in_use,
+                "open": self.open,
+                "max_pool_size": MONGO_MAX_POOL_SIZE,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "wait_timeouts": self.wait_timeouts,
+                "wait_seconds_avg": self.wait_seconds_total / self.checkouts if self.checkouts else 0.0,
+                "wait_seconds_max": self.wait_seconds_max,
+            }
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            wait = event.duration or 0.0
+            self.wait_seconds_total += wait
+            self.wait_seconds_max = max(self.wait_seconds_max, wait)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.wait_timeouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open = max(0, self.open - 1)
+
+    def pool_cleared(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+pool_metrics = PoolMetrics()
+
+def pool_stats() -> Dict[str, Any]:
+    return pool_metrics.snapshot()
+
+# Scraped from the locked snapshot (the listener runs on driver threads)
+for _stat, _help in [
+    ("in_use", "Connections checked out of the pool"),
+    ("open", "Open pool connections"),
+    ("checkouts", "Connection checkouts since start"),
+    ("wait_timeouts", "Checkouts that timed out waiting for a connection"),
+    ("wait_seconds_avg", "Average connection checkout wait"),
+    ("wait_seconds_max", "Longest connection checkout wait"),
+]:
+    Gauge(f"mongo_pool_{_stat}", _help).set_function(lambda stat=_stat: pool_stats()[stat])
+
+# --- Client ---
+
+_client: Optional[AsyncIOMotorClient] = None
+
+def client_options() -> Dict[str, Any]:
+    APP_ENV = os.getenv("APP_ENV", "development")
+    # In 'production', we enforce strict SSL. In 'development', we allow invalid certs if needed.
+    tls_insecure = True if APP_ENV != "production" else False
+
+    options: Dict[str, Any] = {
+        "serverSelectionTimeoutMS": 5000,
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "event_listeners": [pool_metrics, command_monitor],
+    }
+    if MONGO_TLS:
+        options.update(tls=True, tlsAllowInvalidCertificates=tls_insecure)
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    if MONGO_READ_CONCERN:
+        options["readConcernLevel"] = MONGO_READ_CONCERN
+    if MONGO_WRITE_CONCERN:
+        options["w"] = int(MONGO_WRITE_CONCERN) if MONGO_WRITE_CONCERN.isdigit() else MONGO_WRITE_CONCERN
+    return options
+
+def get_client() -> AsyncIOMotorClient:
+    """The process-wide Motor client, created on first use."""
+    global _client
+    if _client is None:
+        _client = AsyncIOMotorClient(os.getenv("MONGO_URI"), **client_options())
+    return _client
+
+def get_database():
+    return get_client()[MONGO_DB]
+
+def close_db():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+async def connect(document_models=None):
+    """Ping the server and bind the Beanie models. Raises on failure (scripts handle it)."""
+    client = get_client()
+    await client.admin.command('ping')
+    document_models = document_models or DOCUMENT_MODELS
+    await init_beanie(database=get_database(), document_models=document_models)
+    if User in document_models:
+        bind_profiles()
+    return client
+
 async def init_db():
     print("🔄 [1/3] Loading Environment Variables...")
     uri = os.getenv("MONGO_URI")
-    
+
     if not uri:
         print("❌ CRITICAL ERROR: 'MONGO_URI' is missing from .env file!")
         return
 
-    print(f"🔄 [2/3] Connecting to MongoDB Atlas (Workaround Mode)...")
-
-    APP_ENV = os.getenv("APP_ENV", "development")
-    # In 'production', we enforce strict SSL. In 'development', we allow invalid certs if needed.
-    tls_insecure = True if APP_ENV != "production" else False
+    print(f"🔄 [2/3] Connecting to MongoDB (pool {MONGO_MIN_POOL_SIZE}-{MONGO_MAX_POOL_SIZE})...")
 
     try:
-        client = AsyncIOMotorClient(
-            uri,
-            tls=True,
-            tlsAllowInvalidCertificates=tls_insecure,
-            serverSelectionTimeoutMS=5000
-        )
-        
         # Test the connection
-        await client.admin.command('ping')
-        print("✅ [SUCCESS] Connection Established! (SSL Verification Skipped)")
+        await get_client().admin.command('ping')
+        print("✅ [SUCCESS] Connection Established!")
 
         print("🔄 [3/3] Initializing Beanie Models...")
 
-        await init_beanie(database=client.whatsapp_dashboard, document_models=[
-            User,
-            Contact,
-            Campaign,
-            Message,
-            Template,
-            SheetImport
-        ])
+        await init_beanie(database=get_database(), document_models=DOCUMENT_MODELS)
+        bind_profiles() # User writes: w:majority
         print("✅ [SUCCESS] Database & Models Ready!")
 
     except Exception as e:
@@ -52,4 +200,4 @@ async def init_db():
         print(f"❌ Error Message: {str(e)}")
         print("\n👇 FULL TRACEBACK:")
         traceback.print_exc()
-        print("---------------------------------------------------\n")
\ No newline at end of file
+        print("---------------------------------------------------\n")
@@ -0,0 +1,47 @@
+from typing import List
+from beanie import Document
+from beanie.odm.utils.dump import get_dict
+from pymongo.read_preferences import SecondaryPreferred
+from pymongo.write_concern import WriteConcern
+from models import User
+import os
+
+# Durability and routing per workload, instead of driver defaults everywhere.
+#   critical  - w:majority; accounts and credentials must survive a failover
+#   fast      - w:1 (primary ack only); campaign blasts, simulated traffic, bulk retagging
+#   analytics - secondaryPreferred with bounded staleness; exports and stats
+MAJORITY_WTIMEOUT_MS = int(os.getenv("MAJORITY_WTIMEOUT_MS", "5000"))
+# The driver rejects anything under 90 seconds
+ANALYTICS_MAX_STALENESS_SECONDS = max(90, int(os.getenv("ANALYTICS_MAX_STALENESS_SECONDS", "120")))
+
+CRITICAL_WRITES = WriteConcern(w="majority", wtimeout=MAJORITY_WTIMEOUT_MS)
+FAST_WRITES = WriteConcern(w=1)
+ANALYTICS_READS = SecondaryPreferred(max_staleness=ANALYTICS_MAX_STALENESS_SECONDS)
+
+def critical(collection):
+    return collection.with_options(write_concern=CRITICAL_WRITES)
+
+def fast(collection):
+    return collection.with_options(write_concern=FAST_WRITES)
+
+def analytics(collection):
+    return collection.with_options(read_preference=ANALYTICS_READS)
+
+def bind_profiles():
+    """
+    Point Beanie's User collection at the critical profile, so register,
+    profile updates, password rehash and token revocation all wait for a
+    majority. Call right after init_beanie.
+    """
+    settings = User.get_settings()
+    settings.motor_collection = critical(settings.motor_collection)
+
+async def insert_fast(documents: List[Document]) -> int:
+    """One unordered w:1 insert_many for a batch of documents of the same model. Sets their ids."""
+    if not documents:
+        return 0
+    collection = fast(type(documents[0]).get_motor_collection())
+    result = await collection.insert_many([get_dict(doc, to_db=True) for doc in documents], ordered=False)
+    for doc, inserted_id in zip(documents, result.inserted_ids):
+        doc.id = inserted_id
+    return len(result.inserted_ids)
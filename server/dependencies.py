@@ -1,34 +1,131 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from pydantic import BaseModel
+from typing import Optional
 import jwt
-from models import User
+import logging
+from bson import ObjectId
+from models import User, UserRole
+from cache import TTLCache
+from invalidation import invalidation, collection_name
 import os
 
+logger = logging.getLogger(__name__)
+
 # Reuse configuration
 SECRET_KEY = os.getenv("JWT_SECRET", "super-secret-key-123")
 ALGORITHM = "HS256"
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
+# Authenticated users by id (the token's `sub`), so polling endpoints don't
+# hit Mongo on every call. Anything that changes a user must invalidate it;
+# the TTL bounds staleness for writes made by other workers.
+user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "60")),
+)
+
+# Current token_version per user id. Much shorter TTL than user_cache: this is
+# all that stands between a revoked token and the claims-only fast path.
+token_version_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("TOKEN_VERSION_TTL", "30")),
+)
+
+# With the change stream live, writes from anywhere evict these entries, so
+# they can be kept much longer.
+invalidation.register_cache(collection_name(User), user_cache,
+                            live_ttl=float(os.getenv("USER_CACHE_LIVE_TTL", "900")))
+invalidation.register_cache(collection_name(User), token_version_cache,
+                            live_ttl=float(os.getenv("TOKEN_VERSION_LIVE_TTL", "300")))
+
+class Principal(BaseModel):
+    """Caller identity built only from verified token claims (no User document)."""
+    id: str
+    email: Optional[str] = None
+    role: UserRole = UserRole.AGENT
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _decode_token(token: str) -> dict:
     try:
-        # DEBUG: Print token (first 10 chars) to verify receipt
-        print(f"🔐 Validating Token: {token[:10]}...")
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("email")
-        if email is None:
-            print("❌ Token invalid: No email in payload")
-            raise credentials_exception
+        if payload.get("sub") is None and payload.get("email") is None:
+            logger.info("Token rejected: no sub/email in payload", extra={"event": "auth.rejected"})
+            raise _credentials_exception()
     except jwt.PyJWTError as e:
-        print(f"❌ Token Decode Error: {e}")
-        raise credentials_exception
-        
-    user = await User.find_one(User.email == email)
+        logger.info("Token rejected: %s", e, extra={"event": "auth.rejected"})
+        raise _credentials_exception()
+    return payload
+
+def invalidate_user(user_id: str):
+    """Forget everything cached about a user (profile, token version)."""
+    user_cache.invalidate(user_id)
+    token_version_cache.invalidate(user_id)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    payload = _decode_token(token)
+    user_id: str = payload.get("sub")
+    email: str = payload.get("email")
+
+    user = user_cache.get(user_id) if user_id else None
     if user is None:
-        raise credentials_exception
+        if user_id:
+            user = await User.get(user_id) if ObjectId.is_valid(user_id) else None
+        else:
+            user = await User.find_one(User.email == email)
+        if user is None:
+            raise _credentials_exception()
+        user_cache.set(str(user.id), user)
+        token_version_cache.set(str(user.id), user.token_version)
+
+    # Checked against token_version_cache (short TTL, evicted by the change
+    # stream), not the long-lived user_cache entry, so a revoke made on
+    # another worker takes effect quickly here too
+    version = await _current_token_version(str(user.id))
+    if version is None or payload.get("ver", 0) < version:
+        raise _credentials_exception()
     return user
+
+async def _current_token_version(user_id: str) -> Optional[int]:
+    version = token_version_cache.get(user_id)
+    if version is not None:
+        return version
+    if not ObjectId.is_valid(user_id):
+        return None
+    doc = await User.get_motor_collection().find_one(
+        {"_id": ObjectId(user_id)}, {str(User.token_version): 1}
+    )
+    if doc is None:
+        return None
+    version = doc.get(str(User.token_version), 0)
+    token_version_cache.set(user_id, version)
+    return version
+
+async def get_current_principal(token: str = Depends(oauth2_scheme)) -> Principal:
+    """
+    Lightweight alternative to get_current_user for read-only routes that only
+    need the caller's id and role. Revocation is still honoured through the
+    cached token_version lookup.
+    """
+    payload = _decode_token(token)
+    user_id = payload.get("sub")
+    if user_id is None:
+        # Legacy email-only token: take the slow path once
+        user = await get_current_user(token)
+        return Principal(id=str(user.id), email=user.email, role=user.role)
+
+    version = await _current_token_version(user_id)
+    if version is None or payload.get("ver", 0) < version:
+        raise _credentials_exception()
+    try:
+        role = UserRole(payload.get("role", UserRole.AGENT))
+    except ValueError:
+        raise _credentials_exception()
+    return Principal(id=user_id, email=payload.get("email"), role=role)
@@ -0,0 +1,85 @@
+from typing import Any, Callable, Dict, List, Optional, Type
+from datetime import datetime
+from enum import Enum
+from bson import ObjectId
+from fastapi import Response
+from pydantic import BaseModel
+from pydantic_core import PydanticUndefined
+import json
+
+try:
+    import orjson
+except ImportError: # Fall back to the stdlib encoder; same output, just slower
+    orjson = None
+
+# Fast read path for list endpoints.
+# Beanie validates every document into a model on load, and FastAPI then
+# validates and serializes it again through response_model. For big lists we
+# skip both: documents come straight off the Motor cursor as dicts (the keys
+# Beanie stores are already the aliases the API returns), get trimmed to the
+# model's fields with its defaults filled in, and are encoded by orjson.
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime): # Only reached by the stdlib fallback
+        return value.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def _plain(value: Any) -> Any:
+    return value.model_dump() if isinstance(value, BaseModel) else value
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+class ReadShape:
+    """
+    The stored/output keys of a model plus their defaults, computed once.
+    `project` is the Mongo projection, `shape(doc)` trims and completes a raw document.
+    """
+    def __init__(self, model: Type[BaseModel], fields: Optional[List[str]] = None):
+        self.keys: List[str] = []
+        self.defaults: Dict[str, Any] = {}
+        self.factories: Dict[str, Callable[[], Any]] = {}
+        for name, field in model.model_fields.items():
+            if name == "revision_id" or (fields is not None and name not in fields):
+                continue
+            key = field.alias or name
+            self.keys.append(key)
+            if field.default is not PydanticUndefined:
+                self.defaults[key] = _plain(field.default)
+            elif field.default_factory is not None:
+                self.factories[key] = lambda factory=field.default_factory: _plain(factory())
+            else:
+                self.defaults[key] = None
+        self.project = {key: 1 for key in self.keys}
+
+    def shape(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        out = {}
+        for key in self.keys:
+            if key in doc:
+                out[key] = doc[key]
+            elif key in self.factories:
+                out[key] = self.factories[key]() # Same as validation would do for an old document
+            else:
+                out[key] = self.defaults[key]
+        return out
+
+async def find_raw(model, shape: ReadShape, query: Optional[dict] = None, sort=None, limit: int = 0) -> List[Dict[str, Any]]:
+    """Run a find on the model's collection and return shaped dicts (no validation)."""
+    cursor = model.get_motor_collection().find(query or {}, shape.project)
+    if sort:
+        cursor = cursor.sort(sort)
+    if limit:
+        cursor = cursor.limit(limit)
+    return [shape.shape(doc) async for doc in cursor]
@@ -0,0 +1,248 @@
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from models import User, Contact, Campaign, Message, Template, SheetImport, SheetImportRow, SheetImportStatus
+from invalidation import collection_name
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+# Every index the app relies on, in one place.
+# Field names come from the models' aliases (what Beanie actually stores:
+# camelCase for most documents, snake_case for User/Campaign), so a renamed
+# field can't silently leave an index on a key nobody writes any more.
+#
+#   python indexes.py apply [--drop]   create missing indexes (and drop unknown ones)
+#   python indexes.py diff             spec vs live database, exit 1 on drift
+#   python indexes.py audit            $indexStats usage + explain() of QUERY_SHAPES, exit 1 on problems
+
+def _key(model, field: str) -> str:
+    """Stored key of a model field."""
+    info = model.model_fields[field]
+    return info.alias or field
+
+logger = logging.getLogger(__name__)
+
+INDEX_SPEC: Dict[str, List[IndexModel]] = {
+    collection_name(User): [
+        IndexModel([(_key(User, "email"), ASCENDING)], unique=True), # Login/register lookups
+    ],
+    collection_name(Contact): [
+        IndexModel([(_key(Contact, "phone"), ASCENDING)]), # Sheet import upserts, imported_numbers
+        IndexModel([(_key(Contact, "tags"), ASCENDING)]), # Multikey: bulk selectors, /contacts/tags
+    ],
+    collection_name(Message): [
+        # Chat history (chatId, sorted by time), last message per chat, purge by chatId
+        IndexModel([(_key(Message, "chat_id"), ASCENDING), (_key(Message, "timestamp"), DESCENDING)]),
+    ],
+    collection_name(Campaign): [
+        IndexModel([(_key(Campaign, "audience_ids"), ASCENDING)]), # Multikey: contact purge $pull
+    ],
+    collection_name(Template): [], # A handful of documents, always read whole
+    collection_name(SheetImport): [
+        IndexModel([(_key(SheetImport, "imported_at"), DESCENDING)]), # Import list, newest first
+        # Latest completed import of a sheet; running/failed imports are left out of the index
+        IndexModel(
+            [(_key(SheetImport, "name"), ASCENDING), (_key(SheetImport, "imported_at"), DESCENDING)],
+            partialFilterExpression={_key(SheetImport, "status"): SheetImportStatus.COMPLETED.value},
+        ),
+    ],
+    collection_name(SheetImportRow): [
+        IndexModel([(_key(SheetImportRow, "import_id"), ASCENDING), (_key(SheetImportRow, "key"), ASCENDING)], unique=True),
+        IndexModel([(_key(SheetImportRow, "key"), ASCENDING)]), # Is a phone still listed by another import?
+    ],
+    "rate_limits": [
+        IndexModel([("expireAt", ASCENDING)], expireAfterSeconds=0), # TTL: see rate_limit.MongoBackend
+    ],
+}
+
+# The queries the app actually runs, with the index each one must use.
+# `audit` explains every shape; a COLLSCAN or a different index is a failure.
+QUERY_SHAPES: List[Dict[str, Any]] = [
+    {"name": "user by email", "collection": collection_name(User), "expect": "email_1",
+     "find": {"filter": {"email": "a@example.com"}}},
+    {"name": "contacts by phone", "collection": collection_name(Contact), "expect": "phone_1",
+     "find": {"filter": {"phone": {"$in": ["15550001", "15550002"]}}}},
+    {"name": "contacts by tag", "collection": collection_name(Contact), "expect": "tags_1",
+     "find": {"filter": {"tags": {"$in": ["vip"]}}}},
+    {"name": "chat history", "collection": collection_name(Message), "expect": "chatId_1_timestamp_-1",
+     "find": {"filter": {"chatId": "x"}, "sort": {"timestamp": 1}}},
+    {"name": "purge messages", "collection": collection_name(Message), "expect": "chatId_1_timestamp_-1",
+     "find": {"filter": {"chatId": {"$in": ["x", "y"]}}, "projection": {"_id": 1}}},
+    {"name": "last message per chat", "collection": collection_name(Message), "expect": "chatId_1_timestamp_-1",
+     "aggregate": [{"$sort": {"chatId": 1, "timestamp": -1}},
+                   {"$group": {"_id": "$chatId", "last": {"$first": "$timestamp"}}}]},
+    {"name": "campaigns by audience member", "collection": collection_name(Campaign), "expect": "audience_ids_1",
+     "find": {"filter": {"audience_ids": {"$in": ["x"]}}}},
+    {"name": "import list", "collection": collection_name(SheetImport), "expect": "importedAt_-1",
+     "find": {"filter": {}, "sort": {"importedAt": -1}}},
+    {"name": "latest completed import of a sheet", "collection": collection_name(SheetImport), "expect": "name_1_importedAt_-1",
+     "find": {"filter": {"name": "x", "status": "completed"}, "sort": {"importedAt": -1}, "limit": 1}},
+    {"name": "rows of an import", "collection": collection_name(SheetImportRow), "expect": "importId_1_key_1",
+     "find": {"filter": {"importId": "x"}, "projection": {"_id": 0, "key": 1}}},
+    {"name": "other imports listing a phone", "collection": collection_name(SheetImportRow), "expect": "key_1",
+     "find": {"filter": {"key": {"$in": ["+15550001"]}, "importId": {"$ne": "x"}}, "projection": {"_id": 0, "key": 1}}},
+]
+
+# --- Spec vs Live ---
+
+_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+def _normalize(doc: Dict[str, Any]) -> Tuple:
+    key = tuple((k, int(v) if isinstance(v, (int, float)) else v) for k, v in doc["key"].items())
+    return key, tuple((opt, doc.get(opt)) for opt in _OPTIONS if doc.get(opt) not in (None, False))
+
+async def _live_indexes(db, collection: str) -> Dict[str, Dict[str, Any]]:
+    return {doc["name"]: doc async for doc in db[collection].list_indexes()}
+
+async def diff_indexes(db) -> Dict[str, Dict[str, List[str]]]:
+    """Per collection: spec indexes that are missing/different, and live ones not in the spec."""
+    report = {}
+    for collection, models in INDEX_SPEC.items():
+        live = await _live_indexes(db, collection)
+        missing, changed = [], []
+        for model in models:
+            spec = model.document
+            current = live.pop(spec["name"], None)
+            if current is None:
+                missing.append(spec["name"])
+            elif _normalize(current) != _normalize(spec):
+                changed.append(spec["name"])
+        extra = [name for name in live if name != "_id_"]
+        if missing or changed or extra:
+            report[collection] = {"missing": missing, "changed": changed, "extra": extra}
+    return report
+
+async def apply_indexes(db, drop: bool = False) -> Dict[str, List[str]]:
+    """
+    Create every spec index (a no-op for the ones that already exist).
+    `drop` also removes indexes the spec doesn't know and rebuilds changed ones.
+    """
+    diff = await diff_indexes(db) if drop else {}
+    created = {}
+    for collection, models in INDEX_SPEC.items():
+        if drop and collection in diff:
+            for name in diff[collection]["extra"] + diff[collection]["changed"]:
+                await db[collection].drop_index(name)
+                logger.info("Dropped index %s.%s", collection, name)
+        if not models:
+            continue
+        try:
+            created[collection] = await db[collection].create_indexes(models)
+        except OperationFailure as e:
+            # Usually an index with the same name but other options; `apply --drop` rebuilds it
+            logger.error("Could not create indexes on %s: %s", collection, e)
+    return created
+
+# --- Usage Audit ---
+
+def _plan_stages(node, stages: List[Tuple[str, Optional[str]]]):
+    """Collect (stage, indexName) pairs from anywhere in an explain() document."""
+    if isinstance(node, dict):
+        if "stage" in node:
+            stages.append((node["stage"], node.get("indexName")))
+        for value in node.values():
+            _plan_stages(value, stages)
+    elif isinstance(node, list):
+        for value in node:
+            _plan_stages(value, stages)
+
+async def explain_shape(db, shape: Dict[str, Any]) -> Dict[str, Any]:
+    if "aggregate" in shape:
+        command = {"aggregate": shape["collection"], "pipeline": shape["aggregate"], "cursor": {}}
+    else:
+        command = {"find": shape["collection"], **shape["find"]}
+    explained = await db.command({"explain": command, "verbosity": "queryPlanner"})
+    # Only the winning plan counts; rejected plans may well scan the collection
+    winning = []
+    _plan_stages(_winning_plans(explained), winning)
+    indexes = sorted({name for _, name in winning if name})
+    collscan = any(stage == "COLLSCAN" for stage, _ in winning)
+    ok = not collscan and shape["expect"] in indexes
+    return {"name": shape["name"], "collection": shape["collection"], "indexes": indexes,
+            "collscan": collscan, "expect": shape["expect"], "ok": ok}
+
+def _winning_plans(node) -> List[Any]:
+    plans = []
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "winningPlan":
+                plans.append(value)
+            elif key != "rejectedPlans":
+                plans.extend(_winning_plans(value))
+    elif isinstance(node, list):
+        for value in node:
+            plans.extend(_winning_plans(value))
+    return plans
+
+async def index_usage(db) -> Dict[str, Dict[str, int]]:
+    """$indexStats ops per index since the last mongod restart."""
+    usage = {}
+    for collection in INDEX_SPEC:
+        stats = db[collection].aggregate([{"$indexStats": {}}])
+        usage[collection] = {doc["name"]: doc["accesses"]["ops"] async for doc in stats}
+    return usage
+
+async def audit_indexes(db) -> bool:
+    healthy = True
+
+    diff = await diff_indexes(db)
+    for collection, problems in diff.items():
+        for kind, names in problems.items():
+            for name in names:
+                print(f"{'⚠️ ' if kind == 'extra' else '❌'} {collection}.{name}: {kind}")
+                healthy = healthy and kind == "extra"
+
+    for collection, indexes in (await index_usage(db)).items():
+        for name, ops in indexes.items():
+            if name != "_id_" and ops == 0:
+                print(f"💤 {collection}.{name}: unused since the last restart")
+
+    for shape in QUERY_SHAPES:
+        result = await explain_shape(db, shape)
+        if result["ok"]:
+            print(f"✅ {result['name']}: {', '.join(result['indexes'])}")
+        else:
+            healthy = False
+            used = "COLLSCAN" if result["collscan"] else ", ".join(result["indexes"]) or "no index"
+            print(f"❌ {result['name']}: expected {result['expect']}, got {used}")
+    return healthy
+
+# --- CLI ---
+
+def _database():
+    from database import get_database
+    if not os.getenv("MONGO_URI"):
+        print("❌ MONGO_URI not found in environment variables.")
+        sys.exit(2)
+    # Against a plain local mongod in CI, set MONGO_TLS=false
+    return get_database()
+
+async def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Apply, diff and audit MongoDB indexes")
+    parser.add_argument("command", choices=["apply", "diff", "audit"])
+    parser.add_argument("--drop", action="store_true", help="apply: drop indexes missing from the spec")
+    args = parser.parse_args(argv)
+    db = _database()
+
+    if args.command == "apply":
+        for collection, names in (await apply_indexes(db, drop=args.drop)).items():
+            print(f"✅ {collection}: {', '.join(names)}")
+        return 0
+    if args.command == "diff":
+        diff = await diff_indexes(db)
+        for collection, problems in diff.items():
+            print(f"{collection}: {problems}")
+        if not diff:
+            print("✅ Live indexes match the spec")
+        return 1 if diff else 0
+    return 0 if await audit_indexes(db) else 1
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from logs import setup_logging
+    load_dotenv()
+    setup_logging()
+    sys.exit(asyncio.run(main()))
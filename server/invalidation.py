@@ -0,0 +1,155 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pymongo.errors import OperationFailure
+import asyncio
+import logging
+import os
+
+# Change-stream driven invalidation for in-process caches.
+# Our own writes already invalidate (versions.bump, invalidate_user), but
+# writes from other workers, sheet imports or seed_data.py don't. This tails
+# one change stream over the watched collections and calls the callbacks
+# registered for that collection with the changed document's id (or None
+# when the whole collection is affected: drop, rename, lost events).
+#
+# While the stream is live, caches registered with a `live_ttl` keep their
+# entries that long; when it goes down they are cleared and fall back to
+# their normal short TTL until it's back.
+
+CACHE_INVALIDATION = os.getenv("CACHE_INVALIDATION", "true").lower() != "false"
+RETRY_SECONDS = float(os.getenv("CACHE_INVALIDATION_RETRY_SECONDS", "5"))
+
+NOT_A_REPLICA_SET = 40573 # $changeStream needs a replica set / Atlas
+RESUME_FAILED = (260, 280, 286) # InvalidResumeToken, ChangeStreamFatalError, ChangeStreamHistoryLost
+logger = logging.getLogger(__name__)
+
+Callback = Callable[[Optional[str]], Any]
+
+def collection_name(model) -> str:
+    """Collection a Beanie model lives in (Settings.name, else the class name)."""
+    settings = getattr(model, "Settings", None)
+    return getattr(settings, "name", None) or model.__name__
+
+class InvalidationService:
+    def __init__(self):
+        self._callbacks: Dict[str, List[Callback]] = {}
+        self._ttl_caches: List[Tuple[Any, float, float]] = [] # (cache, normal ttl, live ttl)
+        self._task: Optional[asyncio.Task] = None
+        self.resume_token: Optional[dict] = None
+        self.live = False
+        self.events = 0
+
+    # --- Registration ---
+
+    def register(self, collection: str, callback: Callback):
+        self._callbacks.setdefault(collection, []).append(callback)
+
+    def register_cache(self, collection: str, cache, live_ttl: Optional[float] = None):
+        """Evict cache[str(_id)] on every change to that document; clear it on collection-wide events."""
+        def evict(doc_id: Optional[str]):
+            if doc_id is None:
+                cache.clear()
+            else:
+                cache.invalidate(doc_id)
+        self.register(collection, evict)
+        if live_ttl is not None:
+            self.extend_ttl(cache, live_ttl)
+
+    def extend_ttl(self, cache, live_ttl: float):
+        """Use `live_ttl` for the cache while the stream is live (for caches invalidated some other way)."""
+        self._ttl_caches.append((cache, cache.ttl, live_ttl))
+        if self.live:
+            cache.ttl = live_ttl
+
+    # --- Lifecycle ---
+
+    async def start(self, db):
+        if not CACHE_INVALIDATION or not self._callbacks or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._set_live(False)
+
+    # --- Stream ---
+
+    def _set_live(self, live: bool):
+        if live == self.live:
+            return
+        self.live = live
+        for cache, normal_ttl, live_ttl in self._ttl_caches:
+            cache.ttl = live_ttl if live else normal_ttl
+            if not live:
+                cache.clear() # Entries stored with the long TTL can't be trusted any more
+        logger.info("Cache invalidation stream %s", "live" if live else "down")
+
+    def _dispatch_all(self):
+        for collection in self._callbacks:
+            self._dispatch(collection, None)
+
+    def _dispatch(self, collection: str, doc_id: Optional[str]):
+        for callback in self._callbacks.get(collection, []):
+            try:
+                callback(doc_id)
+            except Exception as e:
+                logger.error("Cache invalidation callback failed for %s: %s", collection, e)
+
+    def handle(self, change: dict):
+        self.events += 1
+        operation = change.get("operationType")
+        collection = change.get("ns", {}).get("coll")
+        if operation == "dropDatabase":
+            self._dispatch_all()
+        elif operation in ("drop", "rename", "invalidate"):
+            self._dispatch(collection, None)
+        elif collection:
+            key = change.get("documentKey", {}).get("_id")
+            self._dispatch(collection, str(key) if key is not None else None)
+
+    def _pipeline(self) -> List[dict]:
+        return [
+            {"$match": {"$or": [
+                {"ns.coll": {"$in": list(self._callbacks)}},
+                {"operationType": {"$in": ["dropDatabase", "invalidate"]}},
+            ]}},
+            # Only the key is needed; full documents would just be decoded and dropped
+            {"$project": {"operationType": 1, "ns": 1, "documentKey": 1}},
+        ]
+
+    async def _run(self, db):
+        while True:
+            try:
+                async with db.watch(self._pipeline(), resume_after=self.resume_token) as stream:
+                    self._set_live(True)
+                    async for change in stream:
+                        self.handle(change)
+                        self.resume_token = stream.resume_token
+                        if change.get("operationType") == "invalidate":
+                            self.resume_token = None
+                            break
+                self._set_live(False)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code == NOT_A_REPLICA_SET:
+                    logger.warning("Change streams unavailable (not a replica set); caches rely on their TTLs")
+                    self._set_live(False)
+                    return
+                if e.code in RESUME_FAILED:
+                    # Events since the stored token are gone: start over and drop everything cached
+                    self.resume_token = None
+                    self._dispatch_all()
+                logger.error("Cache invalidation stream failed: %s", e)
+                self._set_live(False)
+            except Exception as e:
+                logger.error("Cache invalidation stream failed: %s", e)
+                self._set_live(False)
+            await asyncio.sleep(RETRY_SECONDS)
+
+invalidation = InvalidationService()
@@ -0,0 +1,134 @@
+from typing import Dict, Optional
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from metrics import Counter
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+
+# Structured, non-blocking logging.
+# Loggers only put records on an in-memory queue; a QueueListener thread
+# formats them (JSON lines by default) and writes to stdout. When the queue
+# is full the record is dropped and counted instead of blocking the caller,
+# so a slow terminal or log shipper can never stall the event loop.
+#
+#   LOG_LEVEL      root level (INFO)
+#   LOG_LEVELS     per-module levels: "routers.chat=DEBUG,query_monitor=WARNING"
+#   LOG_FORMAT     json | text
+#   LOG_QUEUE_SIZE records buffered before dropping (10000)
+#   LOG_SAMPLE     keep 1 in N of high-frequency events: "ws.message=50,auth.rejected=10"
+#
+# High-frequency call sites tag records with extra={"event": "<name>"}; only
+# events listed in LOG_SAMPLE are sampled, and warnings and errors never are.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+def _pairs(value: str) -> Dict[str, str]:
+    pairs = {}
+    for item in value.split(","):
+        if "=" in item:
+            key, _, val = item.partition("=")
+            pairs[key.strip()] = val.strip()
+    return pairs
+
+LOG_LEVELS = {name: level.upper() for name, level in _pairs(os.getenv("LOG_LEVELS", "")).items()}
+LOG_SAMPLE = {event: max(1, int(every)) for event, every in _pairs(os.getenv("LOG_SAMPLE", "")).items()}
+
+log_records_dropped = Counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, any `extra` fields, exc."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class SampleFilter(logging.Filter):
+    """Keeps 1 in N records of each event named in LOG_SAMPLE; the kept ones carry `sampled: N`."""
+    def __init__(self):
+        super().__init__()
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock() # Also called from driver threads (query_monitor)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        every = LOG_SAMPLE.get(getattr(record, "event", None), 1)
+        if every == 1:
+            return True
+        with self._lock:
+            seen = self._seen.get(record.event, 0)
+            self._seen[record.event] = seen + 1
+        if seen % every:
+            return False
+        record.sampled = every
+        return True
+
+class DroppingQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only do the cheap part on the caller's thread: resolve %-args and
+        # render tracebacks (exc_info can't cross threads safely); the listener formats
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped.inc()
+
+_listener: Optional[QueueListener] = None
+
+def setup_logging():
+    """Route the root logger through the queue. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        output.setFormatter(JSONFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    records: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(records)
+    handler.addFilter(SampleFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+    for name, level in LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Flush what's queued and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
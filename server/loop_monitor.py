@@ -0,0 +1,104 @@
+from typing import List, Optional
+from collections import deque
+from metrics import Counter, Gauge
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+# Event-loop health.
+# Everything shares one loop, so one blocking call (bcrypt, pandas, a huge
+# serialization) stalls every request and WebSocket. Two pieces:
+#   - a ticker task that sleeps LOOP_TICK_MS and records how late it woke up
+#     (scheduling lag); percentiles over the last LOOP_LAG_WINDOW ticks go to /metrics
+#   - a watchdog thread that notices when the ticker has gone quiet for more
+#     than LOOP_SLOW_CALLBACK_MS and logs the loop thread's stack at that
+#     moment, i.e. the code that is blocking it
+LOOP_MONITOR = os.getenv("LOOP_MONITOR", "true").lower() != "false"
+LOOP_TICK_SECONDS = float(os.getenv("LOOP_TICK_MS", "50")) / 1000
+LOOP_SLOW_CALLBACK_SECONDS = float(os.getenv("LOOP_SLOW_CALLBACK_MS", "100")) / 1000
+LOOP_LAG_WINDOW = int(os.getenv("LOOP_LAG_WINDOW", "1200")) # ~1 minute of ticks
+# asyncio's own debug mode also reports slow callbacks (by handle), but adds overhead everywhere
+LOOP_ASYNCIO_DEBUG = os.getenv("LOOP_ASYNCIO_DEBUG", "false").lower() == "true"
+STACK_DEPTH = 20
+
+QUANTILES = (0.5, 0.9, 0.99, 1.0)
+
+event_loop_lag = Gauge("event_loop_lag_seconds", "Event loop scheduling lag over the recent window", ["quantile"])
+event_loop_blocked = Counter("event_loop_blocked_total", "Times the event loop was blocked longer than LOOP_SLOW_CALLBACK_MS")
+
+logger = logging.getLogger(__name__)
+
+def _percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class LoopMonitor:
+    def __init__(self):
+        self.lags: deque = deque(maxlen=LOOP_LAG_WINDOW)
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_tick = 0.0
+        for q in QUANTILES:
+            event_loop_lag.labels(q).set_function(lambda q=q: self.percentile(q))
+
+    def percentile(self, q: float) -> float:
+        return _percentile(sorted(self.lags), q)
+
+    async def start(self):
+        if not LOOP_MONITOR or self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        if LOOP_ASYNCIO_DEBUG:
+            loop.set_debug(True)
+            loop.slow_callback_duration = LOOP_SLOW_CALLBACK_SECONDS
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.perf_counter()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _tick(self):
+        while True:
+            expected = time.perf_counter() + LOOP_TICK_SECONDS
+            await asyncio.sleep(LOOP_TICK_SECONDS)
+            now = time.perf_counter()
+            self.lags.append(max(0.0, now - expected))
+            self._last_tick = now
+
+    def _watch(self):
+        reported = None # Tick we already logged a stall for: one report per stall
+        while not self._stopped.wait(LOOP_TICK_SECONDS):
+            last_tick = self._last_tick
+            stalled = time.perf_counter() - last_tick - LOOP_TICK_SECONDS
+            if stalled < LOOP_SLOW_CALLBACK_SECONDS or reported == last_tick:
+                continue
+            reported = last_tick
+            event_loop_blocked.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=STACK_DEPTH)) if frame is not None else ""
+            # Logged while still blocked, so this is the time so far; the full lag shows up in the quantiles
+            logger.warning("Event loop blocked for over %.0fms", stalled * 1000,
+                           extra={"blocked_ms": round(stalled * 1000), "stack": stack})
+
+loop_monitor = LoopMonitor()
@@ -1,17 +1,53 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from database import init_db
-from routers import auth, contacts, campaigns, chat
+from database import init_db, close_db, pool_stats
+from rate_limit import RateLimitMiddleware
+from metrics import MetricsMiddleware, render as render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from query_monitor import QueryBudgetMiddleware
+from fastapi.responses import Response
+from routers import auth, contacts, campaigns, chat, templates
+from indexes import apply_indexes
+from invalidation import invalidation
+from loop_monitor import loop_monitor
+from models import User
 from contextlib import asynccontextmanager
+from logs import setup_logging
+import logging
+
+# Before anything logs: records go through a queue to a background writer thread
+# (stopped and flushed at exit)
+setup_logging()
+logger = logging.getLogger("main")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Lag percentiles on /metrics, stack dumps when something blocks the loop
+    await loop_monitor.start()
     # Startup: Connect to MongoDB
     await init_db()
-    print("Startup: Connected to Database")
+    logger.info("Startup: Connected to Database")
+    try:
+        await templates.seed_default_templates()
+    except Exception as e:
+        logger.warning("Startup: Template seeding skipped (%s)", e)
+    # Indexes are normally managed out of band (python indexes.py apply);
+    # creating the missing ones here is cheap and keeps fresh environments usable
+    if os.getenv("INDEXES_ON_STARTUP", "true").lower() != "false":
+        try:
+            await apply_indexes(User.get_motor_collection().database)
+        except Exception as e:
+            logger.warning("Startup: Index sync skipped (%s)", e)
+    # Tail the change stream so caches see writes made outside this worker
+    try:
+        await invalidation.start(User.get_motor_collection().database)
+    except Exception as e:
+        logger.warning("Startup: Cache invalidation stream skipped (%s)", e)
     yield
     # Shutdown
-    print("Shutdown: Database connection closed")
+    await invalidation.stop()
+    await loop_monitor.stop()
+    close_db()
+    logger.info("Shutdown: Database connection closed")
 
 app = FastAPI(lifespan=lifespan)
 
@@ -19,27 +55,47 @@ app = FastAPI(lifespan=lifespan)
 import os
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
 
+# Added before CORS so that 429 responses still carry CORS headers
+app.add_middleware(RateLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-DB-Queries"],
 )
+
+# Counts Mongo commands per request (X-DB-Queries header, N+1 warnings)
+app.add_middleware(QueryBudgetMiddleware)
+
+# Outermost, so rate-limited and CORS-rejected requests are counted too
+app.add_middleware(MetricsMiddleware)
 # Include Routers
 app.include_router(auth.router, prefix="/api")
 app.include_router(contacts.router, prefix="/api")
 app.include_router(campaigns.router, prefix="/api")
 app.include_router(chat.router, prefix="/api")
 # app.include_router(users.router, prefix="/api") # Need to import it first
-from routers import auth, contacts, campaigns, chat, users, templates, integrations, sheets
+from routers import auth, contacts, campaigns, chat, users, templates, integrations, sheets, exports
 app.include_router(users.router, prefix="/api")
 app.include_router(templates.router, prefix="/api")
 app.include_router(integrations.router, prefix="/api")
 app.include_router(sheets.router, prefix="/api")
+app.include_router(exports.router, prefix="/api")
 
 @app.get("/")
 def read_root():
     return {"message": "WhatsApp Dashboard API is running"}
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/health/db")
+def db_health():
+    # Connection pool usage; wait times creeping up mean the pool is too small
+    return pool_stats()
+
 # Trigger Reload
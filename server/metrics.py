@@ -0,0 +1,260 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import bisect
+import math
+import time
+
+# Minimal Prometheus instrumentation, served at /metrics in the text format.
+# Everything is updated from the event loop thread, so children are plain
+# attributes with no locks. Label children are created once and cached, and
+# the middleware keeps its own (method, route) -> children map, so a request
+# costs a couple of dict lookups plus the bisect in Histogram.observe().
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self.labels() # Unlabelled metrics show up as 0 before their first update
+        REGISTRY.append(self)
+
+    def labels(self, *values: str):
+        """Bound child for these label values; keep the result around on hot paths."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _default(self):
+        return self.labels() if not self.labelnames else None
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_labels(self.labelnames, values)} {_number(child.value)}"]
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the value at scrape time instead of tracking it."""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self._default().set_function(function)
+
+    def _render_child(self, values, child):
+        try:
+            value = child.get()
+        except Exception:
+            return [] # A broken callback shouldn't take the whole scrape down
+        return [f"{self.name}{_labels(self.labelnames, values)} {_number(value)}"]
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum", "count")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1) # Last slot: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def _render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), child.counts):
+            cumulative += count
+            le = 'le="' + _number(bound) + '"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {_number(child.sum)}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {child.count}")
+        return lines
+
+REGISTRY: List[_Metric] = []
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- HTTP ---
+
+http_requests = Counter("http_requests_total", "HTTP requests", ["method", "route", "status"])
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency", ["method", "route"])
+http_response_size = Histogram("http_response_size_bytes", "HTTP response body size", ["method", "route"], buckets=SIZE_BUCKETS)
+http_in_flight = Gauge("http_requests_in_flight", "HTTP requests being served")
+
+# --- App ---
+
+websocket_connections = Gauge("websocket_connections", "Open dashboard WebSocket connections")
+campaign_messages_dispatched = Counter("campaign_messages_dispatched_total", "Messages written by campaign sends")
+campaign_dispatch_latency = Histogram("campaign_dispatch_duration_seconds", "Time to dispatch a whole campaign")
+
+UNMATCHED_ROUTE = "unmatched" # 404s etc. stay one series instead of one per random path
+
+def route_template(scope) -> str:
+    """Template of the matched route (/api/chats/{chat_id}/messages), set in scope by the router."""
+    template = getattr(scope.get("route"), "path", None)
+    if template is None:
+        return UNMATCHED_ROUTE
+    # Some FastAPI versions report included routes without the include_router prefix
+    path = scope["path"]
+    extra = path.count("/") - template.count("/")
+    if extra > 0:
+        template = "/".join(path.split("/")[:extra + 1]) + template
+    return template
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording count, latency, size and in-flight requests per route template."""
+    def __init__(self, app):
+        self.app = app
+        self._children: Dict[Tuple[str, str], tuple] = {}
+        self._in_flight = http_in_flight.labels()
+
+    def _bound(self, method: str, route: str) -> tuple:
+        key = (method, route)
+        children = self._children.get(key)
+        if children is None:
+            children = self._children[key] = (
+                {}, # status -> requests counter child
+                http_latency.labels(method, route),
+                http_response_size.labels(method, route),
+            )
+        return children
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status_code = 500
+        size = 0
+        recorded = False
+        self._in_flight.inc()
+
+        def record():
+            nonlocal recorded
+            recorded = True
+            self._in_flight.dec()
+            method = scope["method"]
+            route = route_template(scope)
+            by_status, latency, response_size = self._bound(method, route)
+            counter = by_status.get(status_code)
+            if counter is None:
+                counter = by_status[status_code] = http_requests.labels(method, route, status_code)
+            counter.inc()
+            latency.observe(time.perf_counter() - start)
+            response_size.observe(size)
+
+        async def send_wrapper(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+            # Recorded once the last body chunk is out: BackgroundTasks run
+            # after that, inside the same app call, and are not request latency
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and not recorded:
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not recorded: # No (complete) response was sent: an exception or a disconnect
+                record()
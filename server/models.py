@@ -31,6 +31,12 @@ class CampaignStatus(str, Enum):
     COMPLETED = "completed"
     FAILED = "failed"
 
+class SheetImportStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
 class TemplateCategory(str, Enum):
     MARKETING = "marketing"
     UTILITY = "utility"
@@ -64,11 +70,12 @@ class BaseSchema(BaseModel):
 class User(Document):
     id: Optional[PydanticObjectId] = Field(default=None, alias="_id")
     name: str
-    email: EmailStr = Field(unique=True) # Indexed unique in Mongo
+    email: EmailStr # Unique index: see indexes.py
     password_hash: str
     role: UserRole = UserRole.AGENT
     avatar: Optional[str] = None # Matched to Frontend 'avatar'
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    token_version: int = 0 # Bumped to revoke every token issued so far
 
 # ... inside Campaign ...
 class Contact(Document):
@@ -83,11 +90,7 @@ class Contact(Document):
     unread_count: int = 0
     
     class Settings:
-        name = "contacts"
-        indexes = [
-            "phone",
-            "name"
-        ]
+        name = "contacts" # Indexes live in indexes.py
 
     model_config = ConfigDict(
         alias_generator=to_camel,
@@ -145,10 +148,6 @@ class Message(Document):
 
     class Settings:
         name = "messages"
-        indexes = [
-            "chat_id",
-            "timestamp"
-        ]
 
     model_config = ConfigDict(
         alias_generator=to_camel,
@@ -163,8 +162,36 @@ class SheetImport(Document):
     sheet_id: str
     imported_at: datetime = Field(default_factory=datetime.utcnow)
     row_count: int = 0
+    valid_rows: Optional[int] = None # Distinct valid phones of the last completed run (row_count minus invalid/duplicates)
     mapped_columns: Dict[str, str] = {} # e.g. {"phone": "Column A"}
 
+    # Progress, updated after every upserted batch
+    status: SheetImportStatus = SheetImportStatus.PENDING
+    rows_processed: int = 0
+    contacts_created: int = 0
+    contacts_updated: int = 0
+    duplicates_skipped: int = 0
+    invalid_rows: int = 0
+    error: Optional[str] = None
+    completed_at: Optional[datetime] = None
+    heartbeat_at: Optional[datetime] = None # Refreshed by every save while running (see sheet_import.is_running)
+
+    # Diff of the last run against the previous one (a first import is all "added")
+    rows_added: int = 0
+    rows_changed: int = 0
+    rows_unchanged: int = 0
+    rows_removed: int = 0
+
+    # Fetch cache: validators and content hash of the last completed import
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    last_fetch_status: Optional[str] = None # "fetched" | "not_modified" | "unchanged"
+
+    # CSV dialect detected by sheet_fetch.probe_sheet; probed on the first run if not given
+    encoding: Optional[str] = None
+    delimiter: Optional[str] = None
+
     class Settings:
         name = "sheet_imports"
 
@@ -174,6 +201,59 @@ class SheetImport(Document):
         json_encoders={PydanticObjectId: str}
     )
 
+class SheetImportRow(Document):
+    """One source row of a SheetImport, keyed by its normalized phone."""
+    id: Optional[PydanticObjectId] = Field(default=None, alias="_id")
+    import_id: str
+    key: str
+    hash: Optional[str] = None # row_hash() of the mapped row, used by re-sync
+    created: bool = False # This import's upsert created the contact (delete_removed only deletes those)
+    tags: List[str] = [] # Tags this import put on the contact; dropped from the sheet -> $pull
+
+    class Settings:
+        name = "sheet_import_rows"
+
+    model_config = ConfigDict(
+        alias_generator=to_camel,
+        populate_by_name=True,
+        json_encoders={PydanticObjectId: str}
+    )
+
+
+# --- Read Models (Projections) ---
+# Slim views for lists and summaries. Passed to Beanie's project() (or
+# fastjson.ReadShape) so Mongo only sends the fields the UI renders.
+# Keys match the stored ones: camelCase, except Campaign (snake_case).
+
+class ContactCard(BaseSchema):
+    id: PydanticObjectId = Field(alias="_id")
+    name: str
+    phone: str
+    avatar: Optional[str] = None
+    tags: List[str] = []
+
+class MessagePreview(BaseSchema):
+    id: PydanticObjectId = Field(alias="_id")
+    sender_id: str
+    text: str
+    type: MessageType = MessageType.TEXT
+    status: MessageStatus = MessageStatus.SENT
+    timestamp: datetime
+
+class CampaignRow(BaseModel):
+    id: PydanticObjectId = Field(alias="_id")
+    name: str
+    status: CampaignStatus = CampaignStatus.DRAFT
+    scheduled_date: Optional[datetime] = None
+    stats: CampaignStats = Field(default_factory=CampaignStats)
+    created_at: datetime
+
+class TemplateOption(BaseSchema):
+    id: PydanticObjectId = Field(alias="_id")
+    name: str
+    category: TemplateCategory = TemplateCategory.MARKETING
+    language: TemplateLanguage = TemplateLanguage.EN
+    status: TemplateStatus = TemplateStatus.APPROVED
 
 # --- API Request/Response Models ---
 
@@ -187,6 +267,15 @@ class ChatSession(BaseSchema):
     unread_count: int = 0
     status: str = "active"
 
+class ChatListItem(BaseSchema):
+    """Chat sidebar entry: ChatSession with a contact card and a last-message preview."""
+    id: str
+    contact_id: str
+    contact: ContactCard
+    last_message: Optional[MessagePreview] = None
+    unread_count: int = 0
+    status: str = "active"
+
 class LoginRequest(BaseSchema):
     email: EmailStr
     password: str
@@ -0,0 +1,58 @@
+from typing import List
+from models import Message, Campaign
+from db_profiles import fast
+import versions
+import asyncio
+import logging
+import os
+
+# Deleting a contact with a long chat history in one delete_many can lock up
+# the messages collection for seconds. Instead we remove messages in small
+# batches and sleep between them, and only one purge runs at a time per worker.
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "500"))
+PURGE_PAUSE_SECONDS = float(os.getenv("PURGE_PAUSE_SECONDS", "0.05"))
+logger = logging.getLogger(__name__)
+
+_purge_lock = asyncio.Lock()
+
+async def _purge_messages(chat_ids: List[str]) -> int:
+    collection = fast(Message.get_motor_collection()) # Background cleanup, w:1
+    query = {str(Message.chat_id): {"$in": chat_ids}}
+    deleted = 0
+    while True:
+        batch = await collection.find(query, {"_id": 1}).limit(PURGE_BATCH_SIZE).to_list(PURGE_BATCH_SIZE)
+        if not batch:
+            break
+        result = await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        deleted += result.deleted_count
+        await asyncio.sleep(PURGE_PAUSE_SECONDS)
+    return deleted
+
+async def _purge_campaign_references(contact_ids: List[str]) -> int:
+    result = await Campaign.get_motor_collection().update_many(
+        {"audience_ids": {"$in": contact_ids}},
+        {"$pull": {"audience_ids": {"$in": contact_ids}}},
+    )
+    return result.modified_count
+
+async def purge_contact_data(contact_ids: List[str]):
+    """
+    Remove everything that hangs off deleted contacts: their chat history
+    (chat_id is the contact id) and their place in campaign audiences.
+    Meant to run as a background task after the Contact itself is gone.
+    """
+    if not contact_ids:
+        return
+    async with _purge_lock:
+        try:
+            messages = 0
+            for i in range(0, len(contact_ids), PURGE_BATCH_SIZE):
+                messages += await _purge_messages(contact_ids[i:i + PURGE_BATCH_SIZE])
+            campaigns = 0
+            for i in range(0, len(contact_ids), PURGE_BATCH_SIZE):
+                campaigns += await _purge_campaign_references(contact_ids[i:i + PURGE_BATCH_SIZE])
+            versions.bump("messages")
+            versions.bump("campaigns")
+            logger.info("Purged %d contact(s): %d messages, %d campaigns updated", len(contact_ids), messages, campaigns)
+        except Exception as e:
+            logger.error("Contact purge failed: %s", e)
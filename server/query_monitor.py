@@ -0,0 +1,160 @@
+from typing import Any, Dict, Optional
+from contextvars import ContextVar
+from pymongo import monitoring
+from metrics import Counter, Histogram, route_template
+import os
+import threading
+import logging
+
+# Mongo command monitoring.
+# A CommandListener on the shared client times every command per collection,
+# logs slow ones with the shape of their filter, and counts commands per HTTP
+# request. Motor runs the driver in a thread pool but copies the caller's
+# contextvars into it, so the listener can find the request that issued the
+# command. Requests going over QUERY_BUDGET are flagged as probable N+1s.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "20"))
+QUERY_DEBUG_HEADER = os.getenv("QUERY_DEBUG_HEADER", "true" if os.getenv("APP_ENV", "development") != "production" else "false").lower() == "true"
+
+mongo_command_latency = Histogram("mongo_command_duration_seconds", "Mongo command latency", ["collection", "command"],
+                                  buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+mongo_command_failures = Counter("mongo_command_failures_total", "Failed Mongo commands", ["collection", "command"])
+mongo_slow_commands = Counter("mongo_slow_commands_total", "Mongo commands slower than SLOW_QUERY_MS", ["collection", "command"])
+db_queries_per_request = Histogram("http_request_db_commands", "Mongo commands issued per HTTP request", ["route"],
+                                   buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+n_plus_one_suspected = Counter("http_request_query_budget_exceeded_total", "Requests over QUERY_BUDGET (probable N+1)", ["route"])
+
+logger = logging.getLogger(__name__)
+
+# Commands whose first field isn't the collection name, or that we don't care about
+_SKIP = {"ping", "hello", "isMaster", "ismaster", "buildInfo", "endSessions", "saslStart", "saslContinue", "killCursors"}
+
+class RequestQueries:
+    """Commands issued on behalf of one HTTP request. Updated from driver threads."""
+    __slots__ = ("count", "seconds", "finished", "_lock")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            if self.finished: # Background tasks still carry the request's context
+                return
+            self.count += 1
+            self.seconds += seconds
+
+    def finish(self):
+        with self._lock:
+            self.finished = True
+
+current_request: ContextVar[Optional[RequestQueries]] = ContextVar("current_request", default=None)
+
+def query_shape(value: Any, depth: int = 0) -> Any:
+    """A filter with its values replaced by '?', so it can be logged and grouped safely."""
+    if depth > 4:
+        return "..."
+    if isinstance(value, dict):
+        return {k: query_shape(v, depth + 1) for k, v in value.items()}
+    if isinstance(value, list) and value and isinstance(value[0], dict):
+        return [query_shape(v, depth + 1) for v in value]
+    return "?"
+
+def _command_filter(name: str, command: dict) -> Optional[dict]:
+    if name == "find":
+        return command.get("filter")
+    if name in ("count", "distinct", "findAndModify"):
+        return command.get("query")
+    if name == "aggregate":
+        pipeline = command.get("pipeline") or [{}]
+        return pipeline[0].get("$match")
+    if name in ("update", "delete"):
+        ops = command.get(name + "s") or [{}]
+        return ops[0].get("q")
+    return None
+
+class CommandMonitor(monitoring.CommandListener):
+    def __init__(self):
+        self._lock = threading.Lock() # Metric children are normally event-loop only
+        self._pending: Dict[int, tuple] = {}
+
+    def started(self, event):
+        if event.command_name in _SKIP:
+            return
+        command = event.command
+        collection = command.get("collection") if event.command_name == "getMore" else command.get(event.command_name)
+        # The filter is only needed if the command turns out slow; keep the raw doc reference
+        self._pending[event.request_id] = (str(collection or "-"), command, current_request.get())
+
+    def _finish(self, event, failed: bool):
+        pending = self._pending.pop(event.request_id, None)
+        if pending is None:
+            return
+        collection, command, request = pending
+        seconds = event.duration_micros / 1_000_000
+        name = event.command_name
+        if request is not None:
+            request.add(seconds)
+        with self._lock:
+            mongo_command_latency.labels(collection, name).observe(seconds)
+            if failed:
+                mongo_command_failures.labels(collection, name).inc()
+            if seconds * 1000 >= SLOW_QUERY_MS:
+                mongo_slow_commands.labels(collection, name).inc()
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            shape = query_shape(_command_filter(name, command) or {})
+            sort = command.get("sort") if name == "find" else None
+            logger.warning("Slow %s on %s: %.0fms", name, collection, seconds * 1000, extra={
+                "event": "mongo.slow", "collection": collection, "command": name,
+                "filter": shape, "sort": query_shape(sort) if sort else None,
+            })
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+command_monitor = CommandMonitor()
+
+class QueryBudgetMiddleware:
+    """
+    Pure ASGI middleware: gives each request its own command counter, adds
+    an X-DB-Queries debug header and flags requests over QUERY_BUDGET.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        queries = RequestQueries()
+        token = current_request.set(queries)
+
+        def check_budget():
+            # Stop counting first: BackgroundTasks run after the response, in this same context
+            queries.finish()
+            route = route_template(scope)
+            db_queries_per_request.labels(route).observe(queries.count)
+            if queries.count > QUERY_BUDGET:
+                n_plus_one_suspected.labels(route).inc()
+                logger.warning("Probable N+1: %s %s issued %d Mongo commands (budget %d)", scope["method"], route, queries.count, QUERY_BUDGET,
+                               extra={"event": "mongo.query_budget", "route": route, "commands": queries.count})
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start" and QUERY_DEBUG_HEADER:
+                header = f"{queries.count}; dur={queries.seconds * 1000:.1f}".encode()
+                message["headers"] = list(message.get("headers", [])) + [(b"x-db-queries", header)]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and not queries.finished:
+                check_budget()
+
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            current_request.reset(token)
+            if not queries.finished: # No (complete) response was sent
+                check_budget()
@@ -0,0 +1,185 @@
+from typing import List, Optional, Tuple
+from collections import OrderedDict
+from pydantic import BaseModel
+from datetime import datetime, timedelta
+from models import User
+from indexes import INDEX_SPEC
+from dependencies import SECRET_KEY, ALGORITHM
+import json
+import jwt
+import math
+import os
+import re
+import time
+
+# Sliding-window rate limiting for the expensive/abusable routes.
+# Each (rule, client) pair keeps a counter for the current fixed window and
+# the previous one; the effective count is the current count plus the
+# previous count weighted by how much of it still overlaps the sliding
+# window. That is two integers per client instead of a log of timestamps.
+
+class RateLimitRule(BaseModel):
+    name: str
+    method: str
+    path: str # Regex matched against the full path
+    limit: int
+    window: float # Seconds
+    scope: str = "token" # "token" (the verified user; ip when anonymous or invalid) or "ip"
+
+DEFAULT_RULES = [
+    RateLimitRule(name="login", method="POST", path=r"^/api/auth/login$", limit=10, window=60, scope="ip"),
+    RateLimitRule(name="register", method="POST", path=r"^/api/auth/register$", limit=5, window=60, scope="ip"),
+    RateLimitRule(name="send", method="POST", path=r"^/api/send$", limit=60, window=60),
+    RateLimitRule(name="chat-send", method="POST", path=r"^/api/chats/[^/]+/messages$", limit=120, window=60),
+    RateLimitRule(name="campaign-send", method="POST", path=r"^/api/campaigns/[^/]+/send$", limit=10, window=60),
+    RateLimitRule(name="bulk", method="POST", path=r"^/api/contacts/bulk/", limit=30, window=60),
+]
+
+def load_rules() -> List[RateLimitRule]:
+    """DEFAULT_RULES, or a JSON list of rules from RATE_LIMIT_RULES."""
+    raw = os.getenv("RATE_LIMIT_RULES")
+    if not raw:
+        return DEFAULT_RULES
+    return [RateLimitRule(**rule) for rule in json.loads(raw)]
+
+# --- Backends ---
+
+class InMemoryBackend:
+    """Per-worker counters. Fine for a single worker or as a first line of defence."""
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        # key -> (window index, current, previous), least recently hit first
+        self._windows: "OrderedDict[str, Tuple[int, int, int]]" = OrderedDict()
+
+    async def hit(self, key: str, window_index: int, window: float) -> Tuple[int, int]:
+        index, current, previous = self._windows.get(key, (window_index, 0, 0))
+        if index != window_index:
+            previous = current if index == window_index - 1 else 0
+            current = 0
+        current += 1
+        if key in self._windows:
+            self._windows.move_to_end(key)
+        elif len(self._windows) >= self.max_keys:
+            self._windows.popitem(last=False) # Forget the idlest client, not everyone
+        self._windows[key] = (window_index, current, previous)
+        return current, previous
+
+class MongoBackend:
+    """
+    Counters shared by every worker, one small document per key and window,
+    expired by a TTL index.
+    """
+    def __init__(self, collection_name: str = "rate_limits"):
+        self.collection_name = collection_name
+        self._collection = None
+
+    async def _get_collection(self):
+        if self._collection is None:
+            collection = User.get_motor_collection().database[self.collection_name]
+            await collection.create_indexes(INDEX_SPEC[self.collection_name]) # TTL on expireAt
+            self._collection = collection
+        return self._collection
+
+    async def hit(self, key: str, window_index: int, window: float) -> Tuple[int, int]:
+        collection = await self._get_collection()
+        current_id, previous_id = f"{key}:{window_index}", f"{key}:{window_index - 1}"
+        doc = await collection.find_one_and_update(
+            {"_id": current_id},
+            {"$inc": {"count": 1}, "$setOnInsert": {"expireAt": datetime.utcnow() + timedelta(seconds=window * 2)}},
+            upsert=True,
+            return_document=True,
+        )
+        previous = await collection.find_one({"_id": previous_id}, {"count": 1})
+        return doc["count"], (previous or {}).get("count", 0)
+
+def create_backend():
+    if os.getenv("RATE_LIMIT_BACKEND", "memory") == "mongo":
+        return MongoBackend()
+    return InMemoryBackend()
+
+# --- Middleware ---
+
+class RateLimitMiddleware:
+    """
+    Pure ASGI middleware: requests that match no rule pass straight through
+    after one method check and a handful of regex matches.
+    """
+    def __init__(self, app, rules: Optional[List[RateLimitRule]] = None, backend=None):
+        self.app = app
+        self.rules = [(rule, re.compile(rule.path)) for rule in (rules if rules is not None else load_rules())]
+        self.backend = backend or create_backend()
+        self.enabled = os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "false"
+
+    def _match(self, method: str, path: str) -> Optional[RateLimitRule]:
+        for rule, pattern in self.rules:
+            if rule.method == method and pattern.search(path):
+                return rule
+        return None
+
+    @staticmethod
+    def _client_key(scope, rule: RateLimitRule) -> str:
+        if rule.scope == "token":
+            for name, value in scope.get("headers", []):
+                if name == b"authorization" and value.lower().startswith(b"bearer "):
+                    # Only a verified token counts as an identity (one HMAC check);
+                    # otherwise a fresh fake token per request would dodge the limit
+                    try:
+                        payload = jwt.decode(value[7:], SECRET_KEY, algorithms=[ALGORITHM])
+                    except jwt.PyJWTError:
+                        break
+                    subject = payload.get("sub") or payload.get("email")
+                    if subject:
+                        return f"u:{subject}"
+                    break
+        # The proxy's address unless uvicorn trusts it (FORWARDED_ALLOW_IPS, see render.yaml)
+        client = scope.get("client")
+        return "ip:" + (client[0] if client else "unknown")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            return await self.app(scope, receive, send)
+        rule = self._match(scope["method"], scope["path"])
+        if rule is None:
+            return await self.app(scope, receive, send)
+
+        now = time.time()
+        window_index = int(now // rule.window)
+        key = f"{rule.name}:{self._client_key(scope, rule)}"
+        current, previous = await self.backend.hit(key, window_index, rule.window)
+
+        elapsed = (now % rule.window) / rule.window
+        count = current + previous * (1 - elapsed)
+        remaining = max(0, int(rule.limit - count))
+        limit_headers = [
+            (b"x-ratelimit-limit", str(rule.limit).encode()),
+            (b"x-ratelimit-remaining", str(remaining).encode()),
+        ]
+
+        if count > rule.limit:
+            # Wait until enough of the previous window has slid out (or the current one ends)
+            if previous and current <= rule.limit:
+                wait = (1 - (rule.limit - current) / previous - elapsed) * rule.window
+            else:
+                wait = (1 - elapsed) * rule.window
+            retry_after = str(max(1, math.ceil(wait))).encode()
+            body = json.dumps({"detail": "Too many requests"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", retry_after),
+                    *limit_headers,
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + limit_headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -1,12 +1,18 @@
 from fastapi import APIRouter, HTTPException, Depends
 from models import User, LoginRequest, RegisterRequest, AuthResponse
+from dependencies import get_current_user, invalidate_user
+from concurrent.futures import ThreadPoolExecutor
 # from passlib.context import CryptContext # Removing problematic lib
+import asyncio
 import bcrypt
 import jwt
+import logging
 import datetime
 import os
+import time
 
 router = APIRouter(prefix="/auth", tags=["auth"])
+logger = logging.getLogger(__name__)
 
 SECRET_KEY = os.getenv("JWT_SECRET", "super-secret-key-123")
 ALGORITHM = "HS256"
@@ -16,11 +22,79 @@ def verify_password(plain_password, hashed_password):
     try:
         return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
     except Exception as e:
-        print(f"Bcrypt verify error: {e}")
+        logger.info("Bcrypt verify error: %s", e, extra={"event": "auth.bcrypt_error"})
         return False
 
-def get_password_hash(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+def get_password_hash(password, rounds: int = 12):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+# --- Off-loop Hashing ---
+# bcrypt holds a CPU for 100-300 ms per call. Running it on the event loop
+# freezes every request and WebSocket for that long, so hashing goes to a
+# small dedicated pool, and logins beyond HASH_MAX_PENDING get a 429 instead
+# of queueing without bound.
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "32"))
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_pending = 0
+_bcrypt_rounds = int(os.getenv("BCRYPT_ROUNDS", "0")) or None
+
+def calibrate_bcrypt_rounds(target_ms: float = BCRYPT_TARGET_MS) -> int:
+    """Pick the bcrypt cost whose hash time is closest to `target_ms` on this machine (10..14)."""
+    start = time.perf_counter()
+    bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds=8))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    rounds = 8
+    # Each extra round doubles the work
+    while rounds < 14 and elapsed_ms * 2 <= target_ms * 1.4:
+        elapsed_ms *= 2
+        rounds += 1
+    return max(10, rounds)
+
+def _hash_cost(hashed_password: str) -> int:
+    try:
+        return int(hashed_password.split("$")[2])
+    except (IndexError, ValueError):
+        return 0
+
+async def _run_hashing(fn, *args):
+    global _hash_pending
+    if _hash_pending >= HASH_MAX_PENDING:
+        raise HTTPException(status_code=429, detail="Too many login attempts in progress, retry shortly", headers={"Retry-After": "1"})
+    _hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+    finally:
+        _hash_pending -= 1
+
+async def bcrypt_rounds() -> int:
+    global _bcrypt_rounds
+    if _bcrypt_rounds is None:
+        _bcrypt_rounds = await _run_hashing(calibrate_bcrypt_rounds)
+        logger.info("bcrypt cost calibrated to %d rounds", _bcrypt_rounds)
+    return _bcrypt_rounds
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    return await _run_hashing(verify_password, plain_password, hashed_password)
+
+async def hash_password_async(password) -> str:
+    return await _run_hashing(get_password_hash, password, await bcrypt_rounds())
+
+async def _upgrade_hash(user: User, password: str):
+    """Rehash to the calibrated cost after a successful login, if the stored one is lower."""
+    # Only ever upwards: workers may calibrate differently, and a slower one
+    # must neither weaken hashes nor ping-pong them with a faster one
+    if _hash_cost(user.password_hash) >= await bcrypt_rounds():
+        return
+    try:
+        new_hash = await hash_password_async(password)
+    except HTTPException:
+        return # Busy; try again on the next login
+    await user.set({User.password_hash: new_hash})
+    invalidate_user(str(user.id))
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -41,19 +115,21 @@ async def login(request: LoginRequest):
     # Legacy fallbacks (optional)
     if user.password_hash == "hashed_secret":
         if password in ["password", "password123"]:
-            # Migrate to bcrypt if we wanted, for now just allow
+            # Migrated to bcrypt by _upgrade_hash below
             pass
         else:
              raise HTTPException(status_code=401, detail="Invalid credentials")
     else:
-        is_valid = verify_password(password, user.password_hash)
+        is_valid = await verify_password_async(password, user.password_hash)
         if not is_valid:
             # Do not print passwords in prod, but helpful for user debugging now
             # print(f"   Input: '{password}'") 
             # print(f"   Stored Hash: {user.password_hash}")
             raise HTTPException(status_code=401, detail="Invalid credentials (Password mismatch)")
-    
-    token = create_access_token({"sub": str(user.id), "email": user.email, "role": user.role})
+
+    await _upgrade_hash(user, password)
+
+    token = create_access_token({"sub": str(user.id), "email": user.email, "role": user.role, "ver": user.token_version})
     
     return AuthResponse(user=user, token=token)
 
@@ -64,7 +140,7 @@ async def register(request: RegisterRequest):
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = get_password_hash(request.password)
+    hashed_password = await hash_password_async(request.password)
     
     new_user = User(
         name=request.name,
@@ -74,6 +150,13 @@ async def register(request: RegisterRequest):
     )
     await new_user.insert()
     
-    token = create_access_token({"sub": str(new_user.id), "email": new_user.email, "role": new_user.role})
+    token = create_access_token({"sub": str(new_user.id), "email": new_user.email, "role": new_user.role, "ver": new_user.token_version})
     
     return AuthResponse(user=new_user, token=token)
+
+@router.post("/revoke")
+async def revoke_tokens(current_user: User = Depends(get_current_user)):
+    """Log out everywhere: every token issued to this user so far stops working."""
+    await current_user.inc({User.token_version: 1})
+    invalidate_user(str(current_user.id))
+    return {"ok": True}
@@ -1,23 +1,37 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from typing import List
-from models import Campaign
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
+from typing import List, Literal, Union
+from models import Campaign, CampaignRow
 from beanie import PydanticObjectId
+from conditional import conditional_json
+from fastjson import ReadShape, find_raw
+from db_profiles import insert_fast
+import versions
+import metrics
+import time
 
 router = APIRouter(prefix="/campaigns", tags=["campaigns"])
 
-@router.get("/", response_model=List[Campaign])
-async def get_campaigns():
-    return await Campaign.find_all().to_list()
+_campaign_shape = ReadShape(Campaign)
+_row_shape = ReadShape(CampaignRow)
+
+@router.get("/", response_model=Union[List[Campaign], List[CampaignRow]])
+async def get_campaigns(request: Request, view: Literal["full", "row"] = "full"):
+    # view=row (campaigns table) leaves out audience_ids, which grows with the audience
+    shape = _row_shape if view == "row" else _campaign_shape
+    return await conditional_json(request, ["campaigns"], lambda: find_raw(Campaign, shape))
 
 @router.post("/", response_model=Campaign)
 async def create_campaign(campaign: Campaign):
     await campaign.insert()
+    versions.bump("campaigns")
     return campaign
 
 @router.post("/{campaign_id}/send")
 async def send_campaign(campaign_id: str, background_tasks: BackgroundTasks):
     from routers.chat import simulate_reply  # Import here to avoid circular dependencies if any
-    from models import Contact, Message, MessageStatus, CampaignStatus
+    from models import Contact, ContactCard, Message, MessageStatus, CampaignStatus
+
+    started = time.perf_counter()
 
     # 1. Fetch Campaign
     campaign = await Campaign.get(campaign_id)
@@ -36,29 +50,34 @@ async def send_campaign(campaign_id: str, background_tasks: BackgroundTasks):
          raise HTTPException(status_code=400, detail="No audience defined for this campaign.")
     else:
          # Fetch contacts where ID is in the list
-         contacts = await Contact.find({"_id": {"$in": [PydanticObjectId(oid) for oid in campaign.audience_ids]}}).to_list()
+         # Only id + name are needed to address the message
+         contacts = await Contact.find({"_id": {"$in": [PydanticObjectId(oid) for oid in campaign.audience_ids]}}).project(ContactCard).to_list()
 
-    sent_count = 0
+    # 3. Create the Messages; they go out as one unordered w:1 insert_many
+    messages = []
     for contact in contacts:
-        # 3. Create Message
-        msg = Message(
+        messages.append(Message(
             chat_id=str(contact.id),
             sender_id="me",
             text=f"Hello {contact.name}, this is a campaign message: {campaign.name}", # Templated content would go here
             status=MessageStatus.SENT,
             type="text", # or campaign.template_type
             contact_id=str(contact.id)
-        )
-        await msg.insert()
-        sent_count += 1
-        
-        # 4. Trigger Simulated Reply (The "Customer" replies)
+        ))
+    sent_count = await insert_fast(messages)
+    versions.bump("messages")
+    metrics.campaign_messages_dispatched.inc(sent_count)
+
+    # 4. Trigger Simulated Reply (The "Customer" replies)
+    for contact in contacts:
         background_tasks.add_task(simulate_reply, str(contact.id))
 
     # 5. Update Campaign Status
     campaign.status = CampaignStatus.COMPLETED # or SENDING if async queue
     campaign.stats.sent = sent_count
     await campaign.save()
+    versions.bump("campaigns")
+    metrics.campaign_dispatch_latency.observe(time.perf_counter() - started)
 
     return {"status": "success", "sent_count": sent_count}
 
@@ -1,13 +1,20 @@
-from fastapi import APIRouter, BackgroundTasks, WebSocket, WebSocketDisconnect, Depends
-from typing import List, Dict
+from fastapi import APIRouter, BackgroundTasks, WebSocket, WebSocketDisconnect, Depends, Request
+from typing import List, Dict, Literal, Union
 from pydantic import BaseModel
-from models import Message, ChatSession, Contact, User
-from dependencies import get_current_user
+from models import Message, Contact, ContactCard, MessagePreview, ChatSession, ChatListItem
+from dependencies import get_current_principal, Principal
+from conditional import conditional_json
+from fastjson import FastJSONResponse, ReadShape, find_raw
+from db_profiles import insert_fast
+import versions
+import metrics
 import asyncio
 from datetime import datetime
 import json
+import logging
 
 router = APIRouter(tags=["chat"])
+logger = logging.getLogger(__name__)
 
 # --- WebSocket Connection Manager ---
 class ConnectionManager:
@@ -18,12 +25,12 @@ class ConnectionManager:
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
         self.active_connections.append(websocket)
-        print(f"🔌 Client connected. Total: {len(self.active_connections)}")
+        logger.info("WS client connected", extra={"connections": len(self.active_connections)})
 
     def disconnect(self, websocket: WebSocket):
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
-            print(f"🔌 Client disconnected. Total: {len(self.active_connections)}")
+            logger.info("WS client disconnected", extra={"connections": len(self.active_connections)})
 
     async def broadcast(self, message: dict):
         """Send a message to all connected dashboard clients."""
@@ -31,41 +38,68 @@ class ConnectionManager:
             try:
                 await connection.send_json(message)
             except Exception as e:
-                print(f"Error sending message: {e}")
+                logger.warning("WS broadcast failed: %s", e, extra={"event": "ws.broadcast_failed"})
 
 manager = ConnectionManager()
+metrics.websocket_connections.set_function(lambda: len(manager.active_connections))
 
 # --- HTTP Endpoints ---
 
-@router.get("/chats", response_model=List[ChatSession])
-async def get_chats(current_user: User = Depends(get_current_user)):
+_contact_shape = ReadShape(Contact)
+_card_shape = ReadShape(ContactCard)
+_preview_shape = ReadShape(MessagePreview)
+_message_shape = ReadShape(Message)
+
+async def _last_messages(shape: ReadShape) -> Dict[str, dict]:
+    """Last message of every chat in one aggregation (chatId -> message in `shape`)."""
+    chat_id, timestamp = str(Message.chat_id), str(Message.timestamp)
+    pipeline = [
+        {"$sort": {chat_id: 1, timestamp: -1}}, # Walks the (chatId, timestamp) index
+        {"$group": {"_id": "$" + chat_id, "last": {"$first": {key: "$" + key for key in shape.keys}}}},
+    ]
+    cursor = Message.get_motor_collection().aggregate(pipeline)
+    # $first of a missing field yields nothing, so shape() fills the defaults back in
+    return {doc["_id"]: shape.shape(doc["last"]) async for doc in cursor}
+
+async def _load_chat_sessions(view: str):
+    # Raw dicts in the ChatSession (or, for view=card, ChatListItem) JSON shape
+    card = view == "card"
     # 1. Get all contacts
-    contacts = await Contact.find_all().to_list()
+    contacts = await find_raw(Contact, _card_shape if card else _contact_shape)
+    # 2. Get the last message of every chat at once
+    last_messages = await _last_messages(_preview_shape if card else _message_shape)
     sessions = []
     
     for contact in contacts:
-        # 2. Get last message
-        last_msg = await Message.find(Message.chat_id == str(contact.id)).sort(-Message.timestamp).first_or_none()
+        last_msg = last_messages.get(str(contact["_id"]))
         
         unread = 0
-        if last_msg and last_msg.sender_id == contact.id:
+        if last_msg and last_msg["senderId"] == contact["_id"]:
             unread = 1
             
-        sessions.append(ChatSession(
-            id=str(contact.id),
-            contact_id=str(contact.id),
-            contact=contact,
-            last_message=last_msg,
-            unread_count=unread,
-            status="active"
-        ))
+        sessions.append({
+            "id": str(contact["_id"]),
+            "contactId": str(contact["_id"]),
+            "contact": contact,
+            "lastMessage": last_msg,
+            "unreadCount": unread,
+            "status": "active"
+        })
         
-    sessions.sort(key=lambda x: x.last_message.timestamp if x.last_message else datetime.min, reverse=True)
+    sessions.sort(key=lambda x: x["lastMessage"]["timestamp"] if x["lastMessage"] else datetime.min, reverse=True)
     return sessions
 
+@router.get("/chats", response_model=Union[List[ChatSession], List[ChatListItem]])
+async def get_chats(request: Request, view: Literal["full", "card"] = "full", principal: Principal = Depends(get_current_principal)):
+    # Sessions are built from contacts + their last message.
+    # view=card (sidebar) only fetches contact cards and last-message previews.
+    return await conditional_json(request, ["contacts", "messages"], lambda: _load_chat_sessions(view))
+
 @router.get("/chats/{chat_id}/messages", response_model=List[Message])
-async def get_messages(chat_id: str, current_user: User = Depends(get_current_user)):
-    return await Message.find(Message.chat_id == chat_id).sort(+Message.timestamp).to_list()
+async def get_messages(chat_id: str, principal: Principal = Depends(get_current_principal)):
+    # Long histories: skip model validation and serialize the raw documents directly
+    messages = await find_raw(Message, _message_shape, {str(Message.chat_id): chat_id}, sort=[(str(Message.timestamp), 1)])
+    return FastJSONResponse(messages)
 
 # --- Background Tasks & Logic ---
 
@@ -83,9 +117,10 @@ async def simulate_reply(chat_id: str):
         contact_id=chat_id
     )
     
-    # 2. Save to DB
-    await reply.insert()
-    print(f"Simulated reply sent to chat {chat_id}")
+    # 2. Save to DB (simulated traffic: w:1 is plenty)
+    await insert_fast([reply])
+    versions.bump("messages")
+    logger.debug("Simulated reply sent", extra={"event": "chat.simulated_reply", "chat_id": chat_id})
 
     # 3. Broadcast to WebSocket (Frontend updates instantly)
     # We must convert the Beanie model to a dict or JSON first
@@ -105,6 +140,7 @@ async def send_message(chat_id: str, message: Message, background_tasks: Backgro
     message.contact_id = chat_id
     
     await message.insert()
+    versions.bump("messages")
     
     if message.sender_id == "me":
         # Trigger background reply
@@ -131,6 +167,7 @@ async def send_message_alias(payload: SendMessageRequest, background_tasks: Back
     )
     
     await msg.insert()
+    versions.bump("messages")
     
     # Trigger background reply
     background_tasks.add_task(simulate_reply, payload.chat_id)
@@ -142,21 +179,21 @@ async def send_message_alias(payload: SendMessageRequest, background_tasks: Back
 @router.websocket("/ws/{client_id}")
 @router.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    print(f"🔄 WS Handshake Start: {client_id}")
+    logger.debug("WS handshake start", extra={"client_id": client_id})
     try:
         await manager.connect(websocket)
-        print(f"✅ WS Connected: {client_id}")
+        logger.debug("WS connected", extra={"client_id": client_id})
         while True:
             # We can listed for incoming messages if we want bidirectional sending via WS too
             data = await websocket.receive_text()
             # echo or process? For now just keep connection alive.
             # Maybe handle "typing" events here later.
-            print(f"WS Received from {client_id}: {data}")
+            logger.debug("WS received", extra={"event": "ws.message", "client_id": client_id, "size": len(data)})
     except WebSocketDisconnect:
-        print(f"❌ WS Disconnect: {client_id}")
+        logger.debug("WS disconnect", extra={"client_id": client_id})
         manager.disconnect(websocket)
     except Exception as e:
-        print(f"❌ WS Error: {e}")
+        logger.warning("WS error: %s", e, extra={"client_id": client_id})
         # Ensure we close if something else broke
         try:
              await websocket.close()
@@ -1,18 +1,188 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
-from models import Contact
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
+from typing import List, Literal, Optional, Union
+from pydantic import BaseModel, EmailStr, field_validator
+from pymongo import UpdateMany
+from beanie import PydanticObjectId
+from models import Contact, ContactCard, Campaign
+from purge import purge_contact_data
+from db_profiles import fast
+from conditional import conditional_json
+from fastjson import ReadShape, find_raw
+import versions
 
 router = APIRouter(prefix="/contacts", tags=["contacts"])
 
-@router.get("/", response_model=List[Contact])
-async def get_contacts():
-    return await Contact.find_all().to_list()
+_contact_shape = ReadShape(Contact)
+_card_shape = ReadShape(ContactCard)
+
+@router.get("/", response_model=Union[List[Contact], List[ContactCard]])
+async def get_contacts(request: Request, view: Literal["full", "card"] = "full"):
+    # Raw dicts + orjson; the stored keys already are the camelCase output keys.
+    # view=card (pickers, audience lists) only fetches the ContactCard fields.
+    shape = _card_shape if view == "card" else _contact_shape
+    return await conditional_json(request, ["contacts"], lambda: find_raw(Contact, shape))
 
 @router.post("/", response_model=Contact)
 async def create_contact(contact: Contact):
     await contact.insert()
+    versions.bump("contacts")
     return contact
 
+# --- Bulk Mutations ---
+# Every bulk endpoint resolves its selector to Mongo filters and sends all the
+# resulting operations in a single unordered bulk_write, so retagging or
+# deleting a whole segment is one round-trip instead of one call per contact.
+
+BULK_ID_CHUNK_SIZE = 1000
+
+class ContactSelector(BaseModel):
+    ids: Optional[List[str]] = None
+    tags: Optional[List[str]] = None # Contacts having ANY of these tags
+    segment: Optional[str] = None # Campaign id; targets that campaign's audience
+    all: bool = False # Explicit opt-in to target every contact
+
+class BulkTagRequest(BaseModel):
+    filter: ContactSelector
+    add: List[str] = []
+    remove: List[str] = []
+
+class BulkUpdateFields(BaseModel):
+    # Same validation as Contact: $set bypasses the model, and a bad value
+    # would make the documents unloadable afterwards
+    name: Optional[str] = None
+    email: Optional[EmailStr] = None
+    notes: Optional[str] = None
+    tags: Optional[List[str]] = None
+    unread_count: Optional[int] = None
+
+    @field_validator("name", "tags", "unread_count")
+    @classmethod
+    def not_null(cls, value):
+        # Omitting a field leaves it alone; an explicit null would clear a required field
+        if value is None:
+            raise ValueError("cannot be null")
+        return value
+
+class BulkUpdateRequest(BaseModel):
+    filter: ContactSelector
+    set: BulkUpdateFields
+
+class BulkDeleteRequest(BaseModel):
+    filter: ContactSelector
+
+def _to_object_ids(ids: List[str]) -> List[PydanticObjectId]:
+    try:
+        return [PydanticObjectId(oid) for oid in ids]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid contact id in selector")
+
+async def _resolve_selector(selector: ContactSelector) -> List[dict]:
+    """
+    Turn a selector into one or more Mongo filters.
+    Explicit id lists are split into chunks so a 50k-id selection never
+    builds a single oversized $in document.
+    """
+    ids = list(selector.ids or [])
+    if selector.segment:
+        campaign = await Campaign.get(selector.segment)
+        if not campaign:
+            raise HTTPException(status_code=404, detail="Segment campaign not found")
+        ids.extend(campaign.audience_ids)
+        if not ids:
+            return []
+
+    base = {}
+    if selector.tags:
+        base[str(Contact.tags)] = {"$in": selector.tags}
+
+    if ids:
+        object_ids = _to_object_ids(list(dict.fromkeys(ids)))
+        return [
+            {**base, "_id": {"$in": object_ids[i:i + BULK_ID_CHUNK_SIZE]}}
+            for i in range(0, len(object_ids), BULK_ID_CHUNK_SIZE)
+        ]
+
+    if not base and not selector.all:
+        raise HTTPException(status_code=400, detail="Selector is empty. Pass ids, tags, segment or all=true.")
+    return [base]
+
+async def _bulk_update(filters: List[dict], updates: List[dict]):
+    ops = [UpdateMany(f, u) for u in updates for f in filters]
+    if not ops:
+        return {"matched": 0, "modified": 0}
+    # Retagging/field updates are cheap to redo, so only the primary has to ack (w:1)
+    result = await fast(Contact.get_motor_collection()).bulk_write(ops, ordered=False)
+    versions.bump("contacts")
+    return {"matched": result.matched_count, "modified": result.modified_count}
+
+@router.post("/bulk/tags")
+async def bulk_tag_contacts(payload: BulkTagRequest):
+    """Add and/or remove tags on every selected contact. Counts are summed per operation."""
+    if not payload.add and not payload.remove:
+        raise HTTPException(status_code=400, detail="Nothing to add or remove")
+    if set(payload.add) & set(payload.remove):
+        raise HTTPException(status_code=400, detail="A tag cannot be both added and removed")
+
+    # $addToSet and $pull on the same field conflict inside one update document,
+    # so they go out as two operations of the same bulk_write.
+    updates = []
+    if payload.add:
+        updates.append({"$addToSet": {str(Contact.tags): {"$each": payload.add}}})
+    if payload.remove:
+        updates.append({"$pull": {str(Contact.tags): {"$in": payload.remove}}})
+
+    filters = await _resolve_selector(payload.filter)
+    return await _bulk_update(filters, updates)
+
+@router.post("/bulk/update")
+async def bulk_update_contacts(payload: BulkUpdateRequest):
+    update_data = payload.set.model_dump(exclude_unset=True)
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    # Map python field names to the stored (camelCase) keys
+    fields = {str(getattr(Contact, k)): v for k, v in update_data.items()}
+
+    filters = await _resolve_selector(payload.filter)
+    return await _bulk_update(filters, [{"$set": fields}])
+
+@router.post("/bulk/delete")
+async def bulk_delete_contacts(payload: BulkDeleteRequest, background_tasks: BackgroundTasks):
+    filters = await _resolve_selector(payload.filter)
+    if not filters:
+        return {"deleted": 0}
+    # Page through the matching ids (a single distinct() over a big tenant can
+    # exceed the 16MB response limit), deleting each page and keeping its ids
+    # so their chat history can be purged afterwards
+    collection = Contact.get_motor_collection()
+    contact_ids = []
+    deleted = 0
+    for f in filters:
+        last_id = None
+        while True:
+            page_filter = {"$and": [f, {"_id": {"$gt": last_id}}]} if last_id is not None else f
+            page = [doc["_id"] async for doc in collection.find(page_filter, {"_id": 1}).sort("_id", 1).limit(BULK_ID_CHUNK_SIZE)]
+            if not page:
+                break
+            result = await collection.delete_many({"_id": {"$in": page}})
+            deleted += result.deleted_count
+            contact_ids.extend(str(oid) for oid in page)
+            last_id = page[-1]
+    versions.bump("contacts")
+    background_tasks.add_task(purge_contact_data, contact_ids)
+    return {"deleted": deleted}
+
+# Declared before /{contact_id}, which would otherwise capture "tags" as an id
+@router.get("/tags", response_model=List[str])
+async def get_tags():
+    # Aggregation to find all unique tags
+    # Since Beanie doesn't strictly support distinct() in all versions easily, 
+    # we can fetch all or use a raw pipeline. 
+    # For a prototype, fetching all and filtering in python is okay if data is small, 
+    # but aggregation is better.
+    
+    # distinct() runs server side, so only the tag strings cross the wire
+    return await Contact.get_motor_collection().distinct(str(Contact.tags))
+
 @router.get("/{contact_id}", response_model=Contact)
 async def get_contact(contact_id: str):
     contact = await Contact.get(contact_id)
@@ -21,11 +191,14 @@ async def get_contact(contact_id: str):
     return contact
 
 @router.delete("/{contact_id}")
-async def delete_contact(contact_id: str):
+async def delete_contact(contact_id: str, background_tasks: BackgroundTasks):
     contact = await Contact.get(contact_id)
     if not contact:
         raise HTTPException(status_code=404, detail="Contact not found")
     await contact.delete()
+    versions.bump("contacts")
+    # Messages and campaign references are removed in throttled batches after the response
+    background_tasks.add_task(purge_contact_data, [str(contact.id)])
     return {"ok": True}
 
 from pydantic import BaseModel
@@ -46,21 +219,6 @@ async def update_contact(contact_id: str, payload: UpdateContactRequest):
     # Update fields if provided
     update_data = payload.model_dump(exclude_unset=True)
     await contact.set(update_data)
+    versions.bump("contacts")
     
     return contact
-
-@router.get("/tags", response_model=List[str])
-async def get_tags():
-    # Aggregation to find all unique tags
-    # Since Beanie doesn't strictly support distinct() in all versions easily, 
-    # we can fetch all or use a raw pipeline. 
-    # For a prototype, fetching all and filtering in python is okay if data is small, 
-    # but aggregation is better.
-    
-    # Simple list set approach for prototype:
-    contacts = await Contact.find_all().to_list()
-    all_tags = set()
-    for c in contacts:
-        for tag in c.tags:
-            all_tags.add(tag)
-    return list(all_tags)
@@ -0,0 +1,116 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Dict, List, Literal
+from datetime import datetime
+from enum import Enum
+from models import Contact, Message
+from dependencies import get_current_principal, Principal
+from db_profiles import analytics
+import csv
+import io
+import json
+import zlib
+
+router = APIRouter(prefix="/exports", tags=["exports"])
+
+# Columns are fixed (instead of taken from the first document) so every CSV
+# chunk lines up with the header, even when later documents miss a field.
+CONTACT_COLUMNS = ["id", "name", "phone", "email", "tags", "notes", "lastActive", "unreadCount"]
+MESSAGE_COLUMNS = ["id", "chatId", "senderId", "text", "type", "mediaUrl", "status", "timestamp", "contactId"]
+
+ExportFormat = Literal["csv", "ndjson"]
+
+# --- Row Encoding ---
+
+def _plain(value):
+    """Make a raw Mongo value JSON/CSV friendly."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value) # ObjectId and friends
+
+def _row(doc: dict, columns: List[str]) -> Dict:
+    doc["id"] = doc.pop("_id", None)
+    return {col: _plain(doc.get(col)) for col in columns}
+
+def _encode_ndjson(rows: List[Dict], columns: List[str], first: bool) -> str:
+    return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+def _encode_csv(rows: List[Dict], columns: List[str], first: bool) -> str:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if first:
+        writer.writerow(columns)
+    for row in rows:
+        writer.writerow([";".join(v) if isinstance(v, list) else ("" if v is None else v) for v in row.values()])
+    return buf.getvalue()
+
+ENCODERS = {"csv": _encode_csv, "ndjson": _encode_ndjson}
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+async def _stream_rows(collection, query: dict, sort, columns: List[str], fmt: ExportFormat,
+                       batch_size: int, compress: bool) -> AsyncIterator[bytes]:
+    """
+    Walk a raw Motor cursor and yield one encoded chunk per batch.
+    Only one batch is ever held in memory, and the first bytes go out as soon
+    as Mongo returns the first batch.
+    """
+    encode = ENCODERS[fmt]
+    gz = zlib.compressobj(wbits=31) if compress else None # 31 = gzip container
+    projection = {("_id" if c == "id" else c): 1 for c in columns}
+    cursor = collection.find(query, projection, batch_size=batch_size)
+    if sort:
+        cursor = cursor.sort(sort)
+
+    first = True
+    batch = []
+    async for doc in cursor:
+        batch.append(_row(doc, columns))
+        if len(batch) >= batch_size:
+            chunk = encode(batch, columns, first).encode("utf-8")
+            first = False
+            batch = []
+            yield gz.compress(chunk) if gz else chunk
+
+    if batch or first:
+        chunk = encode(batch, columns, first).encode("utf-8")
+        yield gz.compress(chunk) if gz else chunk
+    if gz:
+        yield gz.flush()
+
+def _export_response(stream: AsyncIterator[bytes], filename: str, fmt: ExportFormat, compress: bool):
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.{fmt}{".gz" if compress else ""}"'}
+    if compress:
+        return StreamingResponse(stream, media_type="application/gzip", headers=headers)
+    return StreamingResponse(stream, media_type=MEDIA_TYPES[fmt], headers=headers)
+
+# --- HTTP Endpoints ---
+
+@router.get("/contacts")
+async def export_contacts(
+    format: ExportFormat = "csv",
+    gzip: bool = False,
+    batch_size: int = Query(1000, ge=1, le=10000),
+    principal: Principal = Depends(get_current_principal),
+):
+    # Exports tolerate slightly stale data, so they read from a secondary when one is available
+    stream = _stream_rows(analytics(Contact.get_motor_collection()), {}, [("_id", 1)],
+                          CONTACT_COLUMNS, format, batch_size, gzip)
+    return _export_response(stream, "contacts", format, gzip)
+
+@router.get("/chats/{chat_id}/messages")
+async def export_chat_messages(
+    chat_id: str,
+    format: ExportFormat = "ndjson",
+    gzip: bool = False,
+    batch_size: int = Query(1000, ge=1, le=10000),
+    principal: Principal = Depends(get_current_principal),
+):
+    stream = _stream_rows(analytics(Message.get_motor_collection()), {str(Message.chat_id): chat_id},
+                          [(str(Message.timestamp), 1)], MESSAGE_COLUMNS, format, batch_size, gzip)
+    return _export_response(stream, f"chat-{chat_id}", format, gzip)
@@ -1,41 +1,168 @@
-from fastapi import APIRouter, HTTPException, Depends
-from models import User
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from typing import Dict, List, Optional
+from models import User, SheetImport, SheetImportStatus
 from dependencies import get_current_user
 from pydantic import BaseModel
+from beanie import PydanticObjectId
+from starlette.concurrency import run_in_threadpool
+from sheet_import import export_url, sheet_id_from_url, tab_url, guess_mapping, run_sheet_import, run_sheet_batch, diff_summary, is_running
+from sheet_fetch import probe_sheet
+import logging
 
 router = APIRouter(prefix="/integrations", tags=["integrations"])
+logger = logging.getLogger(__name__)
 
 class GoogleSheetConnect(BaseModel):
     sheet_url: str
 
 @router.post("/google-sheets/connect")
 async def connect_google_sheet(data: GoogleSheetConnect, current_user: User = Depends(get_current_user)):
+    # Standard: https://docs.google.com/spreadsheets/d/SHEET_ID/edit#gid=0
+    # Export: https://docs.google.com/spreadsheets/d/SHEET_ID/export?format=csv
+    if not data.sheet_url.startswith(("http://", "https://")):
+        raise HTTPException(status_code=400, detail="sheet_url must be an http(s) link")
+    url = export_url(data.sheet_url)
     try:
-        import pandas as pd
-        
-        # 1. Optimize URL for CSV export (if it's a standard web link)
-        # Standard: https://docs.google.com/spreadsheets/d/SHEET_ID/edit#gid=0
-        # Export: https://docs.google.com/spreadsheets/d/SHEET_ID/export?format=csv
-        
-        url = data.sheet_url
-        if "/edit" in url:
-            url = url.split("/edit")[0] + "/export?format=csv"
-            
-        # 2. Attempt to read
+        # Only the first few KB are read, just enough for the header and some sample rows.
         # This works for "Published to Web" sheets or Public (Anyone with link) if permissions allow CSV export
-        df = pd.read_csv(url, nrows=5) # Read only first few rows for header
-        
-        columns = df.columns.tolist()
-        
-        return {
-            "status": "success",
-            "message": "Connected to Google Sheet successfully",
-            "sheet_id": url.split("/d/")[1].split("/")[0] if "/d/" in url else "unknown",
-            "columns_mapped": columns
-        }
-        
+        probe = await run_in_threadpool(probe_sheet, url)
     except Exception as e:
-        # If pandas fails, it might be private. check for Service Account (Advanced)
+        # If the probe fails, it might be private. check for Service Account (Advanced)
         # For now, return error as requested for "Public" sheets.
-        print(f"Sheet Error: {e}")
+        logger.warning("Sheet connect failed: %s", e)
         raise HTTPException(status_code=400, detail=f"Failed to connect. Ensure sheet is 'Public' or 'Published to Web'. Error: {str(e)}")
+
+    return {
+        "status": "success",
+        "message": "Connected to Google Sheet successfully",
+        "sheet_id": sheet_id_from_url(url),
+        "columns_mapped": probe.columns,
+        "suggested_mapping": guess_mapping(probe.columns),
+        "sample_rows": probe.sample_rows,
+        "delimiter": probe.delimiter,
+        "encoding": probe.encoding
+    }
+
+class GoogleSheetImportRequest(BaseModel):
+    sheet_url: str
+    name: Optional[str] = None
+    mapped_columns: Dict[str, str] = {} # e.g. {"phone": "Mobile"}; guessed from headers if empty
+    encoding: Optional[str] = None # As returned by /connect; probed on the first run if empty
+    delimiter: Optional[str] = None
+
+@router.post("/google-sheets/import", response_model=SheetImport)
+async def import_google_sheet(data: GoogleSheetImportRequest, background_tasks: BackgroundTasks, current_user: User = Depends(get_current_user)):
+    """Start a streaming import of the sheet into contacts. Poll the returned import for progress."""
+    if not data.sheet_url.startswith(("http://", "https://")):
+        raise HTTPException(status_code=400, detail="sheet_url must be an http(s) link")
+    if data.mapped_columns and "phone" not in data.mapped_columns:
+        raise HTTPException(status_code=400, detail="mapped_columns must include a 'phone' column")
+
+    sheet_import = SheetImport(
+        name=data.name or sheet_id_from_url(data.sheet_url),
+        sheet_url=data.sheet_url,
+        sheet_id=sheet_id_from_url(data.sheet_url),
+        mapped_columns=data.mapped_columns,
+        encoding=data.encoding,
+        delimiter=data.delimiter
+    )
+    await sheet_import.insert()
+    background_tasks.add_task(run_sheet_import, sheet_import, export_url(data.sheet_url))
+    return sheet_import
+
+@router.get("/google-sheets/imports/{import_id}", response_model=SheetImport)
+async def get_sheet_import(import_id: str, current_user: User = Depends(get_current_user)):
+    sheet_import = await SheetImport.get(import_id)
+    if not sheet_import:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return sheet_import
+
+@router.post("/google-sheets/imports/{import_id}/sync")
+async def sync_sheet_import(
+    import_id: str,
+    background_tasks: BackgroundTasks,
+    delete_removed: bool = False,
+    background: bool = False,
+    force: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Re-read the sheet and write only rows whose content changed since the last run.
+    Returns the diff summary, or immediately with status "running" when background=true.
+    An unmodified export (304 or same content hash) is not parsed at all unless force=true.
+    """
+    sheet_import = await SheetImport.get(import_id)
+    if not sheet_import:
+        raise HTTPException(status_code=404, detail="Import not found")
+    if is_running(sheet_import):
+        raise HTTPException(status_code=409, detail="Import is already running")
+
+    if background:
+        background_tasks.add_task(run_sheet_import, sheet_import, None, delete_removed, force)
+        return {"id": import_id, "status": SheetImportStatus.RUNNING}
+
+    await run_sheet_import(sheet_import, delete_removed=delete_removed, force=force)
+    if sheet_import.status == SheetImportStatus.FAILED:
+        raise HTTPException(status_code=400, detail=f"Sync failed: {sheet_import.error}")
+    return {
+        "id": import_id,
+        "status": sheet_import.status,
+        "fetch": sheet_import.last_fetch_status,
+        "diff": diff_summary(sheet_import)
+    }
+
+class SheetBatchItem(BaseModel):
+    sheet_url: str
+    name: Optional[str] = None
+    mapped_columns: Dict[str, str] = {}
+    gids: List[str] = [] # Tabs to import; empty means the tab in the link
+
+class SheetBatchRequest(BaseModel):
+    sheets: List[SheetBatchItem] = [] # New sheets/tabs to import
+    import_ids: List[str] = [] # Existing imports to re-sync
+    resync_all: bool = False # Re-sync every existing import (nightly refresh)
+    delete_removed: bool = False
+    force: bool = False
+    concurrency: Optional[int] = None
+
+@router.post("/google-sheets/import/batch")
+async def import_google_sheets_batch(data: SheetBatchRequest, background_tasks: BackgroundTasks, current_user: User = Depends(get_current_user)):
+    """
+    Import or re-sync many sheets concurrently in the background.
+    Returns the ids of the imports involved; poll them for progress.
+    """
+    imports = []
+    for item in data.sheets:
+        if not item.sheet_url.startswith(("http://", "https://")):
+            raise HTTPException(status_code=400, detail=f"sheet_url must be an http(s) link: {item.sheet_url}")
+        base_name = item.name or sheet_id_from_url(item.sheet_url)
+        tabs = [(tab_url(item.sheet_url, gid), f"{base_name} #{gid}") for gid in item.gids] or [(item.sheet_url, base_name)]
+        for url, name in tabs:
+            sheet_import = SheetImport(
+                name=name,
+                sheet_url=url,
+                sheet_id=sheet_id_from_url(url),
+                mapped_columns=item.mapped_columns
+            )
+            await sheet_import.insert()
+            imports.append(sheet_import)
+
+    if data.resync_all:
+        existing = await SheetImport.find_all().to_list()
+    else:
+        try:
+            ids = [PydanticObjectId(i) for i in data.import_ids]
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid import id")
+        existing = await SheetImport.find({"_id": {"$in": ids}}).to_list()
+    known = {str(i.id) for i in imports}
+    imports.extend(i for i in existing if str(i.id) not in known and not is_running(i))
+
+    if not imports:
+        raise HTTPException(status_code=400, detail="No sheets to import")
+
+    kwargs = {"delete_removed": data.delete_removed, "force": data.force}
+    if data.concurrency:
+        kwargs["concurrency"] = max(1, data.concurrency)
+    background_tasks.add_task(run_sheet_batch, imports, **kwargs)
+    return {"status": "running", "import_ids": [str(i.id) for i in imports]}
@@ -1,8 +1,8 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from typing import List, Optional
 from pydantic import BaseModel
-from dependencies import get_current_user
-from models import User
+from dependencies import get_current_principal, Principal
+from models import SheetImport, SheetImportRow, SheetImportStatus, Contact, ContactCard
 
 router = APIRouter(prefix="/sheets", tags=["sheets"])
 
@@ -15,20 +15,25 @@ class ImportedContact(BaseModel):
     phone: str
 
 @router.get("/", response_model=List[SheetInfo])
-async def get_sheets(current_user: User = Depends(get_current_user)):
-    return [
-        {"id": "sheet1", "name": "Q1 Leads"},
-        {"id": "sheet2", "name": "Webinar Signups"},
-        {"id": "sheet3", "name": "Newsletter Subscribers"}
-    ]
+async def get_sheets(principal: Principal = Depends(get_current_principal)):
+    imports = await SheetImport.find_all().sort(-SheetImport.imported_at).to_list()
+    return [SheetInfo(id=str(i.id), name=i.name) for i in imports]
 
 @router.get("/imported_numbers", response_model=List[ImportedContact])
-async def get_imported_numbers(sheet_name: Optional[str] = None, current_user: User = Depends(get_current_user)):
-    # Mock return of contacts based on info
-    return [
-        {"name": "Alice Smith", "phone": "+15550100"},
-        {"name": "Bob Jones", "phone": "+15550101"},
-        {"name": "Charlie Brown", "phone": "+15550102"},
-        {"name": "David Wilson", "phone": "+15550103"},
-        {"name": "Eve Davis", "phone": "+15550104"}
-    ]
+async def get_imported_numbers(
+    sheet_name: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    principal: Principal = Depends(get_current_principal)
+):
+    # Latest completed import of that sheet (or the latest completed import overall);
+    # a running or failed import only has part of the rows
+    query = SheetImport.find(SheetImport.status == SheetImportStatus.COMPLETED)
+    if sheet_name:
+        query = query.find(SheetImport.name == sheet_name)
+    sheet_import = await query.sort(-SheetImport.imported_at).first_or_none()
+    if not sheet_import:
+        raise HTTPException(status_code=404, detail="Sheet import not found")
+
+    rows = await SheetImportRow.find(SheetImportRow.import_id == str(sheet_import.id)).limit(limit).to_list()
+    contacts = await Contact.find({str(Contact.phone): {"$in": [r.key for r in rows]}}).project(ContactCard).to_list()
+    return [ImportedContact(name=c.name, phone=c.phone) for c in contacts]
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from typing import List, Optional
-from models import Template, User
-from dependencies import get_current_user
+from fastapi import APIRouter, HTTPException, Depends, Request, status
+from typing import List, Literal, Optional, Union
+from models import Template, TemplateOption, User
+from dependencies import get_current_user, get_current_principal, Principal
 from pydantic import BaseModel
+from conditional import conditional_json
+from fastjson import ReadShape, find_raw
+import versions
+import logging
 
 router = APIRouter(prefix="/templates", tags=["templates"])
+logger = logging.getLogger(__name__)
 
 class TemplateCreate(BaseModel):
     name: str
@@ -12,20 +17,34 @@ class TemplateCreate(BaseModel):
     language: str = "en"
     category: str = "marketing"
 
-@router.get("/", response_model=List[Template])
-async def get_templates(current_user: User = Depends(get_current_user)):
-    templates = await Template.find_all().to_list()
-    if not templates:
-        # Seed mocking data
-        mock_templates = [
-            Template(name="Welcome", content="Hello {{name}}, welcome to our service!", category="marketing"),
-            Template(name="Discount", content="Get 50% off with code SAVE50", category="marketing"),
-            Template(name="Reminder", content="Hi, just a reminder about your appointment.", category="utility")
-        ]
-        for t in mock_templates:
-            await t.insert()
-        templates = mock_templates
-    return templates
+_template_shape = ReadShape(Template)
+_option_shape = ReadShape(TemplateOption)
+
+DEFAULT_TEMPLATES = [
+    {"name": "Welcome", "content": "Hello {{name}}, welcome to our service!", "category": "marketing"},
+    {"name": "Discount", "content": "Get 50% off with code SAVE50", "category": "marketing"},
+    {"name": "Reminder", "content": "Hi, just a reminder about your appointment.", "category": "utility"},
+]
+
+async def seed_default_templates():
+    """Insert the demo templates into an empty collection. Called once at startup."""
+    if await Template.find_all().limit(1).count():
+        return
+    await Template.insert_many([Template(**t) for t in DEFAULT_TEMPLATES])
+    versions.bump("templates")
+    logger.info("Seeded %d default templates", len(DEFAULT_TEMPLATES))
+
+@router.get("/", response_model=Union[List[Template], List[TemplateOption]])
+async def get_templates(
+    request: Request,
+    view: Literal["full", "option"] = "full",
+    principal: Principal = Depends(get_current_principal)
+):
+    # Small and hot (campaign builder): keep the serialized body, not just the ETag.
+    # view=option (dropdowns) skips content and components.
+    shape = _option_shape if view == "option" else _template_shape
+    return await conditional_json(request, ["templates"], lambda: find_raw(Template, shape),
+                                  cache_body=True)
 
 @router.post("/", response_model=Template, status_code=status.HTTP_201_CREATED)
 async def create_template(template: TemplateCreate, current_user: User = Depends(get_current_user)):
@@ -37,6 +56,7 @@ async def create_template(template: TemplateCreate, current_user: User = Depends
         status="approved" # Auto-approve for now
     )
     await new_template.insert()
+    versions.bump("templates")
     return new_template
 
 @router.delete("/{template_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -45,3 +65,4 @@ async def delete_template(template_id: str, current_user: User = Depends(get_cur
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
     await template.delete()
+    versions.bump("templates")
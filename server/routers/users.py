@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 from models import User
-from dependencies import get_current_user
+from dependencies import get_current_user, invalidate_user
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -16,6 +16,8 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
 
 @router.put("/me", response_model=User)
 async def update_user_me(user_update: UserUpdate, current_user: User = Depends(get_current_user)):
+    # Drop the cached instance before mutating it, so a failed update can't leak into other requests
+    invalidate_user(str(current_user.id))
     if user_update.name:
         current_user.name = user_update.name
     if user_update.email:
@@ -27,4 +29,6 @@ async def update_user_me(user_update: UserUpdate, current_user: User = Depends(g
             current_user.email = user_update.email
             
     await current_user.save()
+    # Again after the write: a concurrent request may have cached the old document meanwhile
+    invalidate_user(str(current_user.id))
     return current_user
@@ -1,9 +1,7 @@
 import asyncio
 import os
-from database import init_db
+from database import connect
 from models import Campaign, Template, CampaignStatus, TemplateCategory
-from beanie import init_beanie
-from motor.motor_asyncio import AsyncIOMotorClient
 from models import Campaign, Template, CampaignStatus, TemplateCategory, Contact, Message, User
 import random
 from datetime import datetime, timedelta
@@ -16,18 +14,9 @@ async def seed():
         return
 
     try:
-        client = AsyncIOMotorClient(
-            MONGO_URI,
-            tls=True,
-            tlsAllowInvalidCertificates=True,
-            serverSelectionTimeoutMS=5000
-        )
-        # Verify connection
-        await client.admin.command('ping')
+        # Shared client from database.py (same pool/TLS settings as the app)
+        await connect([Campaign, Template, Contact, Message, User])
         print("✅ Connected to MongoDB")
-        
-        # Initialize Beanie with explicit database
-        await init_beanie(database=client.whatsapp_dashboard, document_models=[Campaign, Template, Contact, Message, User])
     except Exception as e:
         print(f"❌ Connection failed: {e}")
         return
@@ -0,0 +1,150 @@
+from typing import List, Optional
+from pydantic import BaseModel
+import codecs
+import csv
+import hashlib
+import io
+import os
+import requests
+import tempfile
+
+# Fetch layer for sheet exports. Remote exports are requested conditionally
+# (If-None-Match / If-Modified-Since) and spooled to a local file while being
+# hashed, so an unchanged sheet costs a 304 or one download, never a parse.
+SHEET_CACHE_DIR = os.getenv("SHEET_CACHE_DIR", tempfile.gettempdir())
+FETCH_TIMEOUT_SECONDS = float(os.getenv("SHEET_FETCH_TIMEOUT", "30"))
+FETCH_CHUNK_BYTES = 64 * 1024
+PROBE_MAX_BYTES = int(os.getenv("SHEET_PROBE_MAX_BYTES", str(16 * 1024)))
+
+FETCHED = "fetched"
+NOT_MODIFIED = "not_modified" # Server answered 304
+UNCHANGED = "unchanged" # Downloaded, but the content hash matches the last import
+
+class SheetFetch(BaseModel):
+    status: str
+    path: Optional[str] = None
+    temporary: bool = False # True if `path` is a spooled download the caller must remove
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(FETCH_CHUNK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def fetch_sheet(source: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+                content_hash: Optional[str] = None) -> SheetFetch:
+    """
+    Fetch a sheet export, short-circuiting when it has not changed.
+    Pass the validators and hash stored from the last successful import; leave
+    them empty to force a full fetch. Blocking: run it in the threadpool.
+    """
+    if not source.startswith(("http://", "https://")):
+        path = source[len("file://"):] if source.startswith("file://") else source
+        new_hash = _hash_file(path)
+        status = UNCHANGED if content_hash and new_hash == content_hash else FETCHED
+        return SheetFetch(status=status, path=path, content_hash=new_hash)
+
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    with requests.get(source, headers=headers, stream=True, timeout=FETCH_TIMEOUT_SECONDS) as resp:
+        if resp.status_code == 304:
+            return SheetFetch(status=NOT_MODIFIED, etag=etag, last_modified=last_modified, content_hash=content_hash)
+        resp.raise_for_status()
+
+        digest = hashlib.sha256()
+        os.makedirs(SHEET_CACHE_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix="sheet-", suffix=".csv", dir=SHEET_CACHE_DIR)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for block in resp.iter_content(FETCH_CHUNK_BYTES):
+                    digest.update(block)
+                    out.write(block)
+        except Exception:
+            os.remove(path)
+            raise
+
+        fetched = SheetFetch(
+            status=FETCHED,
+            path=path,
+            temporary=True,
+            etag=resp.headers.get("ETag"),
+            last_modified=resp.headers.get("Last-Modified"),
+            content_hash=digest.hexdigest(),
+        )
+
+    if content_hash and fetched.content_hash == content_hash:
+        os.remove(path)
+        fetched.status, fetched.path, fetched.temporary = UNCHANGED, None, False
+    return fetched
+
+# --- Header Probe ---
+
+class SheetProbe(BaseModel):
+    columns: List[str]
+    sample_rows: List[List[str]]
+    delimiter: str
+    encoding: str
+
+def _sniff_encoding(head: bytes, declared: Optional[str]) -> str:
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    try:
+        # A multi-byte character may be cut at the end of the probe window
+        head.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        if e.start >= len(head) - 3:
+            return "utf-8"
+    return declared or "cp1252"
+
+def _read_head(source: str, max_bytes: int):
+    """First `max_bytes` of a sheet export, plus whether the stream was cut short."""
+    if not source.startswith(("http://", "https://")):
+        path = source[len("file://"):] if source.startswith("file://") else source
+        with open(path, "rb") as f:
+            head = f.read(max_bytes + 1)
+        return head[:max_bytes], len(head) > max_bytes, None
+
+    with requests.get(source, stream=True, timeout=FETCH_TIMEOUT_SECONDS) as resp:
+        resp.raise_for_status()
+        head = b""
+        for block in resp.iter_content(4096):
+            head += block
+            if len(head) > max_bytes:
+                break
+        # Leaving the with-block closes the connection without draining the body
+        declared = resp.encoding if "charset" in resp.headers.get("Content-Type", "") else None
+        return head[:max_bytes], len(head) > max_bytes, declared
+
+def probe_sheet(source: str, sample_size: int = 5, max_bytes: int = PROBE_MAX_BYTES) -> SheetProbe:
+    """
+    Read only the first few KB of a sheet export and return its header and a
+    few sample rows. Blocking: run it in the threadpool.
+    """
+    head, truncated, declared = _read_head(source, max_bytes)
+    encoding = _sniff_encoding(head, declared)
+    text = head.decode(encoding, errors="ignore")
+    if truncated and "\n" in text:
+        text = text[:text.rindex("\n") + 1] # Drop the partial last line
+
+    try:
+        delimiter = csv.Sniffer().sniff(text.split("\n", 1)[0], delimiters=",;\t|").delimiter
+    except csv.Error:
+        delimiter = ","
+
+    rows = csv.reader(io.StringIO(text), delimiter=delimiter)
+    columns = next(rows, [])
+    if not columns:
+        raise ValueError("Sheet export is empty")
+    sample = [row for _, row in zip(range(sample_size), rows)]
+    return SheetProbe(columns=columns, sample_rows=sample, delimiter=delimiter, encoding=encoding)
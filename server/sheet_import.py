@@ -0,0 +1,458 @@
+from typing import Dict, Iterator, List, Optional
+from contextlib import contextmanager
+from datetime import datetime
+from pymongo import UpdateOne
+from pydantic import EmailStr, TypeAdapter, ValidationError
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from models import Contact, SheetImport, SheetImportRow, SheetImportStatus
+from purge import purge_contact_data
+from sheet_fetch import fetch_sheet, probe_sheet, FETCHED
+import versions
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+# Exports are spooled to a local file by sheet_fetch, then parsed with the csv
+# module straight off that file and handed to Mongo in batches, so a sheet with hundreds of thousands of rows
+# never sits in memory as a whole.
+IMPORT_BATCH_SIZE = int(os.getenv("SHEET_IMPORT_BATCH_SIZE", "1000"))
+PROGRESS_INTERVAL_SECONDS = 2.0 # How often a running import writes its counters
+SHEET_IMPORT_CONCURRENCY = int(os.getenv("SHEET_IMPORT_CONCURRENCY", "4"))
+# A RUNNING import whose heartbeat is older than this lost its worker (restart, crash) and may be re-run
+SHEET_IMPORT_LEASE_SECONDS = float(os.getenv("SHEET_IMPORT_LEASE_SECONDS", "600"))
+logger = logging.getLogger(__name__)
+
+# Header spellings we map automatically when no mapping was saved
+HEADER_ALIASES = {
+    "name": ["name", "full name", "fullname", "contact", "contact name"],
+    "phone": ["phone", "phone number", "mobile", "whatsapp", "number", "tel", "telephone"],
+    "email": ["email", "e-mail", "email address", "mail"],
+    "tags": ["tags", "tag", "labels", "segment"],
+    "notes": ["notes", "note", "comment", "comments"],
+}
+
+# --- URL Helpers ---
+
+def export_url(sheet_url: str) -> str:
+    """
+    Turn a Google Sheets web link into its CSV export link.
+    https://docs.google.com/spreadsheets/d/SHEET_ID/edit#gid=0
+      -> https://docs.google.com/spreadsheets/d/SHEET_ID/export?format=csv&gid=0
+    Anything else (already an export link, a local stand-in server) is returned as-is.
+    """
+    if "/edit" not in sheet_url:
+        return sheet_url
+    base, _, rest = sheet_url.partition("/edit")
+    gid = re.search(r"gid=(\d+)", rest)
+    return base + "/export?format=csv" + (f"&gid={gid.group(1)}" if gid else "")
+
+def sheet_id_from_url(sheet_url: str) -> str:
+    return sheet_url.split("/d/")[1].split("/")[0] if "/d/" in sheet_url else "unknown"
+
+# --- Streaming CSV Reader ---
+
+@contextmanager
+def open_csv(path: str, encoding: Optional[str] = None):
+    """
+    Open a sheet export as a text stream. `path` is a local file: the spooled
+    download from fetch_sheet, or the sheet itself for file-based imports.
+    `encoding` comes from probe_sheet; UTF-8 (with or without BOM) when unknown.
+    """
+    path = path[len("file://"):] if path.startswith("file://") else path
+    with open(path, encoding=encoding or "utf-8-sig", errors="replace", newline="") as f:
+        yield f
+
+def iter_row_chunks(source: str, chunk_size: int = IMPORT_BATCH_SIZE, encoding: Optional[str] = None,
+                    delimiter: Optional[str] = None) -> Iterator[List[Dict[str, str]]]:
+    """Yield the sheet's rows as header-keyed dicts, `chunk_size` at a time."""
+    with open_csv(source, encoding) as stream:
+        reader = csv.DictReader(stream, delimiter=delimiter or ",")
+        chunk = []
+        for row in reader:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+def iter_mapped_chunks(source: str, mapping: Dict[str, str], chunk_size: int = IMPORT_BATCH_SIZE,
+                       encoding: Optional[str] = None, delimiter: Optional[str] = None):
+    """
+    Parse, map and hash rows, `chunk_size` at a time, so all per-row CPU work
+    happens wherever this generator is driven (the threadpool), not on the loop.
+    Yields (mapping, rows) where each row is (contact, hash) or None if unusable.
+    The mapping is guessed from the header when none was saved.
+    """
+    for chunk in iter_row_chunks(source, chunk_size, encoding, delimiter):
+        if not mapping:
+            mapping = guess_mapping(list(chunk[0].keys()))
+            if "phone" not in mapping:
+                raise ValueError(f"No phone column found in headers: {list(chunk[0].keys())}")
+        rows = []
+        for row in chunk:
+            contact = map_row(row, mapping)
+            rows.append((contact, row_hash(contact)) if contact else None)
+        yield mapping, rows
+
+# --- Row Mapping ---
+
+def guess_mapping(headers: List[str]) -> Dict[str, str]:
+    """Map contact fields to sheet headers by common spellings."""
+    normalized = {h.strip().lower(): h for h in headers if h}
+    mapping = {}
+    for field, aliases in HEADER_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized:
+                mapping[field] = normalized[alias]
+                break
+    return mapping
+
+def normalize_phone(raw: Optional[str]) -> Optional[str]:
+    """Keep digits and a leading '+'. Returns None for values too short to be a number."""
+    if not raw:
+        return None
+    raw = raw.strip()
+    digits = re.sub(r"\D", "", raw)
+    if len(digits) < 6:
+        return None
+    return ("+" if raw.startswith("+") else "") + digits
+
+_email = TypeAdapter(EmailStr)
+
+def _valid_email(value: str) -> Optional[str]:
+    # Contact.email is an EmailStr; storing anything else makes the contact unloadable
+    try:
+        return _email.validate_python(value)
+    except ValidationError:
+        return None
+
+def map_row(row: Dict[str, str], mapping: Dict[str, str]) -> Optional[Dict]:
+    """Apply a column mapping to one sheet row. Returns None if the row has no usable phone."""
+    values = {field: (row.get(column) or "").strip() for field, column in mapping.items()}
+    phone = normalize_phone(values.get("phone"))
+    if not phone:
+        return None
+    contact = {"phone": phone, "name": values.get("name") or phone}
+    email = _valid_email(values["email"]) if values.get("email") else None
+    if email:
+        contact["email"] = email # A malformed address is dropped; the rest of the row still imports
+    if values.get("notes"):
+        contact["notes"] = values["notes"]
+    tags = [t.strip() for t in re.split(r"[;,]", values.get("tags", "")) if t.strip()]
+    if tags:
+        contact["tags"] = tags
+    return contact
+
+# --- Persistence ---
+
+def _contact_upsert(contact: Dict) -> UpdateOne:
+    fields = {str(getattr(Contact, k)): v for k, v in contact.items() if k != "tags"}
+    update = {
+        "$set": fields,
+        "$setOnInsert": {
+            str(Contact.last_active): datetime.utcnow(),
+            str(Contact.unread_count): 0,
+        },
+    }
+    if contact.get("tags"):
+        update["$addToSet"] = {str(Contact.tags): {"$each": contact["tags"]}}
+    else:
+        update["$setOnInsert"][str(Contact.tags)] = []
+    return UpdateOne({str(Contact.phone): contact["phone"]}, update, upsert=True)
+
+async def upsert_contacts(contacts: List[Dict]):
+    """Upsert contacts by phone in one unordered bulk_write. Returns (phones created, number updated)."""
+    if not contacts:
+        return set(), 0
+    result = await Contact.get_motor_collection().bulk_write(
+        [_contact_upsert(c) for c in contacts], ordered=False
+    )
+    versions.bump("contacts")
+    return {contacts[i]["phone"] for i in result.upserted_ids}, result.modified_count
+
+def row_hash(contact: Dict) -> str:
+    """Compact fingerprint of a mapped row. Unmapped columns don't affect it."""
+    payload = json.dumps(contact, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=8).hexdigest()
+
+async def load_rows(import_id: str, keys: List[str]) -> Dict[str, dict]:
+    """Stored row records (hash, tags) for the given keys of one import (one indexed query)."""
+    cursor = SheetImportRow.get_motor_collection().find(
+        {str(SheetImportRow.import_id): import_id, str(SheetImportRow.key): {"$in": keys}},
+        {"_id": 0, str(SheetImportRow.key): 1, str(SheetImportRow.hash): 1, str(SheetImportRow.tags): 1},
+    )
+    return {doc["key"]: doc async for doc in cursor}
+
+async def pull_dropped_tags(import_id: str, dropped: Dict[str, List[str]]) -> int:
+    """
+    Remove tags a sheet no longer lists from its contacts. Upserts only
+    $addToSet tags (manual tags survive), so shrinking needs its own $pull;
+    tags another import still puts on the same phone are kept.
+    """
+    if not dropped:
+        return 0
+    cursor = SheetImportRow.get_motor_collection().find(
+        {str(SheetImportRow.key): {"$in": list(dropped)}, str(SheetImportRow.import_id): {"$ne": import_id}},
+        {"_id": 0, str(SheetImportRow.key): 1, str(SheetImportRow.tags): 1},
+    )
+    async for doc in cursor:
+        dropped[doc["key"]] = [t for t in dropped[doc["key"]] if t not in doc.get("tags", [])]
+    ops = [UpdateOne({str(Contact.phone): key}, {"$pull": {str(Contact.tags): {"$in": tags}}})
+           for key, tags in dropped.items() if tags]
+    if not ops:
+        return 0
+    result = await Contact.get_motor_collection().bulk_write(ops, ordered=False)
+    versions.bump("contacts")
+    return result.modified_count
+
+async def record_rows(import_id: str, contacts: Dict[str, Dict], hashes: Dict[str, str], created: set = frozenset()):
+    """
+    Store the hash and tags of the rows written; keys in `created` are also
+    marked as contacts this import created.
+    """
+    if not contacts:
+        return
+    ops = []
+    for key, contact in contacts.items():
+        fields = {str(SheetImportRow.hash): hashes[key], str(SheetImportRow.tags): contact.get("tags", [])}
+        if key in created:
+            fields[str(SheetImportRow.created)] = True
+        ops.append(UpdateOne({str(SheetImportRow.import_id): import_id, str(SheetImportRow.key): key},
+                             {"$set": fields}, upsert=True))
+    await SheetImportRow.get_motor_collection().bulk_write(ops, ordered=False)
+
+async def _listed_elsewhere(import_id: str, keys: List[str]) -> set:
+    """Those of `keys` that some other import still has a row for."""
+    return set(await SheetImportRow.get_motor_collection().distinct(str(SheetImportRow.key), {
+        str(SheetImportRow.key): {"$in": keys},
+        str(SheetImportRow.import_id): {"$ne": import_id},
+    }))
+
+async def remove_missing_rows(import_id: str, seen: set, delete_contacts: bool) -> int:
+    """
+    Drop row records for keys that are no longer in the sheet and, if asked,
+    the contacts behind them. Only contacts this import created and that no
+    other import still lists are deleted; anything else just loses its row
+    record. Only keys are read, so this stays cheap.
+    """
+    collection = SheetImportRow.get_motor_collection()
+    query = {str(SheetImportRow.import_id): import_id}
+    removed, owned = [], set()
+    async for doc in collection.find(query, {"_id": 0, str(SheetImportRow.key): 1, str(SheetImportRow.created): 1}):
+        if doc["key"] not in seen:
+            removed.append(doc["key"])
+            if doc.get("created"):
+                owned.add(doc["key"])
+    if not removed:
+        return 0
+
+    for i in range(0, len(removed), IMPORT_BATCH_SIZE):
+        keys = removed[i:i + IMPORT_BATCH_SIZE]
+        await collection.delete_many({**query, str(SheetImportRow.key): {"$in": keys}})
+        if not delete_contacts:
+            continue
+        deletable = [key for key in keys if key in owned]
+        if deletable:
+            deletable = list(set(deletable) - await _listed_elsewhere(import_id, deletable))
+        if deletable:
+            contact_query = {str(Contact.phone): {"$in": deletable}}
+            contact_ids = [str(oid) for oid in await Contact.get_motor_collection().distinct("_id", contact_query)]
+            await Contact.get_motor_collection().delete_many(contact_query)
+            versions.bump("contacts")
+            await purge_contact_data(contact_ids)
+    return len(removed)
+
+# --- Pipeline ---
+
+def is_running(sheet_import: SheetImport) -> bool:
+    """RUNNING and still heartbeating; a stale RUNNING status is left behind by a worker that died."""
+    if sheet_import.status != SheetImportStatus.RUNNING:
+        return False
+    heartbeat = sheet_import.heartbeat_at or sheet_import.imported_at
+    return (datetime.utcnow() - heartbeat).total_seconds() < SHEET_IMPORT_LEASE_SECONDS
+
+async def _save_progress(sheet_import: SheetImport):
+    sheet_import.heartbeat_at = datetime.utcnow()
+    await sheet_import.save()
+
+def _reset_run_counters(sheet_import: SheetImport):
+    for field in ("rows_processed", "contacts_created", "contacts_updated", "duplicates_skipped",
+                  "invalid_rows", "rows_added", "rows_changed", "rows_unchanged", "rows_removed"):
+        setattr(sheet_import, field, 0)
+    sheet_import.error = None
+    sheet_import.completed_at = None
+
+async def run_sheet_import(sheet_import: SheetImport, source: Optional[str] = None,
+                           delete_removed: bool = False, force: bool = False,
+                           written: Optional[set] = None):
+    """
+    Stream a sheet into contacts and keep `sheet_import` updated with progress.
+    Parsing, mapping and hashing happen in the threadpool so the event loop
+    only ever waits on Mongo.
+
+    The same pipeline serves the first import and every re-sync: each row's
+    hash is compared with the one stored for its key, and only new or changed
+    rows are written. Keys that disappeared from the sheet are counted as
+    removed (and their contacts deleted when `delete_removed` is set).
+
+    Before any of that the export is fetched conditionally; a 304 or an
+    identical content hash ends the run without parsing (unless `force`).
+
+    `written` is the set of phones already upserted by other sheets of the
+    same batch (see run_sheet_batch); those rows are not written again.
+    """
+    source = source or export_url(sheet_import.sheet_url)
+    import_id = str(sheet_import.id)
+    mapping = dict(sheet_import.mapped_columns)
+    seen = set()
+
+    # Validators are only trusted if the last run actually finished
+    use_cache = not force and sheet_import.status == SheetImportStatus.COMPLETED
+    previous_rows = sheet_import.row_count
+    previous_invalid = sheet_import.invalid_rows
+    previous_valid = sheet_import.valid_rows
+    if previous_valid is None: # Completed before valid_rows was stored
+        previous_valid = previous_rows - previous_invalid - sheet_import.duplicates_skipped
+
+    _reset_run_counters(sheet_import)
+    sheet_import.status = SheetImportStatus.RUNNING
+    await _save_progress(sheet_import)
+    last_progress = time.monotonic()
+
+    fetched = None
+    try:
+        fetched = await run_in_threadpool(
+            fetch_sheet, source,
+            sheet_import.etag if use_cache else None,
+            sheet_import.last_modified if use_cache else None,
+            sheet_import.content_hash if use_cache else None,
+        )
+        sheet_import.last_fetch_status = fetched.status
+        if fetched.status != FETCHED:
+            # Nothing changed upstream: the sheet's rows are what the last run saw, all unchanged
+            sheet_import.row_count = sheet_import.rows_processed = previous_rows
+            sheet_import.rows_unchanged = previous_valid
+            sheet_import.invalid_rows = previous_invalid
+            sheet_import.duplicates_skipped = previous_rows - previous_invalid - previous_valid
+            sheet_import.status = SheetImportStatus.COMPLETED
+            sheet_import.completed_at = datetime.utcnow()
+            await sheet_import.save()
+            return sheet_import
+
+        if not sheet_import.encoding or not sheet_import.delimiter:
+            # Sniff the dialect once from the head of the downloaded file; later syncs reuse it
+            probe = await run_in_threadpool(probe_sheet, fetched.path)
+            sheet_import.encoding = sheet_import.encoding or probe.encoding
+            sheet_import.delimiter = sheet_import.delimiter or probe.delimiter
+
+        chunks = iter_mapped_chunks(fetched.path, mapping, encoding=sheet_import.encoding, delimiter=sheet_import.delimiter)
+        async for mapping, rows in iterate_in_threadpool(chunks):
+            sheet_import.mapped_columns = mapping
+
+            batch = {}
+            hashes = {}
+            for row in rows:
+                if row is None:
+                    sheet_import.invalid_rows += 1
+                elif row[0]["phone"] in seen:
+                    sheet_import.duplicates_skipped += 1
+                else:
+                    contact, h = row
+                    seen.add(contact["phone"])
+                    batch[contact["phone"]] = contact
+                    hashes[contact["phone"]] = h
+
+            stored = await load_rows(import_id, list(batch))
+            changed = {key: h for key, h in hashes.items() if stored.get(key, {}).get("hash") != h}
+            sheet_import.rows_added += sum(1 for key in changed if key not in stored)
+            sheet_import.rows_changed += sum(1 for key in changed if key in stored)
+            sheet_import.rows_unchanged += len(hashes) - len(changed)
+
+            # In a batch run a phone is written once, by whichever sheet gets to it first
+            to_write = [key for key in changed if written is None or key not in written]
+            if written is not None:
+                written.update(to_write)
+                sheet_import.duplicates_skipped += len(changed) - len(to_write)
+
+            created, updated = await upsert_contacts([batch[key] for key in to_write])
+            dropped = {}
+            for key in to_write:
+                tags = [t for t in stored.get(key, {}).get("tags", []) if t not in batch[key].get("tags", [])]
+                if tags:
+                    dropped[key] = tags
+            updated += await pull_dropped_tags(import_id, dropped)
+            # Only what this sheet actually wrote: a deferred key stays "changed",
+            # so the next sync of this sheet still applies its values
+            await record_rows(import_id, {key: batch[key] for key in to_write}, changed, created)
+
+            sheet_import.rows_processed += len(rows)
+            sheet_import.contacts_created += len(created)
+            sheet_import.contacts_updated += updated
+            if time.monotonic() - last_progress >= PROGRESS_INTERVAL_SECONDS:
+                await _save_progress(sheet_import)
+                last_progress = time.monotonic()
+
+        sheet_import.rows_removed = await remove_missing_rows(import_id, seen, delete_removed)
+        sheet_import.row_count = sheet_import.rows_processed
+        sheet_import.valid_rows = len(seen)
+        sheet_import.etag = fetched.etag
+        sheet_import.last_modified = fetched.last_modified
+        sheet_import.content_hash = fetched.content_hash
+        sheet_import.status = SheetImportStatus.COMPLETED
+    except Exception as e:
+        logger.error("Sheet import %s failed: %s", import_id, e)
+        sheet_import.status = SheetImportStatus.FAILED
+        sheet_import.error = str(e)
+    finally:
+        if fetched and fetched.temporary:
+            os.remove(fetched.path)
+
+    sheet_import.completed_at = datetime.utcnow()
+    await sheet_import.save()
+    return sheet_import
+
+def diff_summary(sheet_import: SheetImport) -> Dict[str, int]:
+    return {
+        "added": sheet_import.rows_added,
+        "changed": sheet_import.rows_changed,
+        "unchanged": sheet_import.rows_unchanged,
+        "removed": sheet_import.rows_removed,
+        "invalid": sheet_import.invalid_rows,
+        "duplicates": sheet_import.duplicates_skipped,
+    }
+
+# --- Batch Runs ---
+
+def tab_url(sheet_url: str, gid: str) -> str:
+    """Web link of one tab (gid) of a Google Sheet."""
+    if "/d/" not in sheet_url:
+        return sheet_url
+    return sheet_url.split("/edit")[0].split("/export")[0] + f"/edit#gid={gid}"
+
+async def run_sheet_batch(imports: List[SheetImport], delete_removed: bool = False, force: bool = False,
+                          concurrency: int = SHEET_IMPORT_CONCURRENCY) -> Dict[str, int]:
+    """
+    Run many imports at once, at most `concurrency` at a time. Fetching and
+    parsing overlap across sheets; all of them share one dedup set, so a phone
+    present in several sheets is upserted once per batch.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    written = set()
+
+    async def run_one(sheet_import: SheetImport):
+        async with semaphore:
+            await run_sheet_import(sheet_import, delete_removed=delete_removed, force=force, written=written)
+
+    await asyncio.gather(*(run_one(i) for i in imports))
+    logger.info("Sheet batch done: %d sheets, %d contacts written", len(imports), len(written))
+    return {
+        "sheets": len(imports),
+        "failed": sum(1 for i in imports if i.status == SheetImportStatus.FAILED),
+        "contacts_written": len(written),
+    }
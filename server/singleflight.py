@@ -0,0 +1,39 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from cache import TTLCache
+import asyncio
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical computations: the first caller for a key
+    starts the work, everyone arriving while it runs awaits the same result.
+    The work runs in its own task, so a caller that disconnects (and gets
+    cancelled) doesn't cancel it for the others.
+
+    With `microcache` > 0 the result is also kept for that many seconds, so a
+    burst that arrives just after the computation finished still shares it.
+    """
+    def __init__(self, microcache: float = 0.0, maxsize: int = 256):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._recent = TTLCache(maxsize=maxsize, ttl=microcache) if microcache > 0 else None
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if self._recent is not None:
+            cached = self._recent.get(key)
+            if cached is not None:
+                return cached
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if self._recent is not None and not task.cancelled() and task.exception() is None:
+            self._recent.set(key, task.result())
+
+    def __len__(self):
+        return len(self._inflight)
@@ -1,8 +1,7 @@
 import asyncio
 import os
 from colorama import init, Fore, Style
-from motor.motor_asyncio import AsyncIOMotorClient
-from beanie import init_beanie
+from database import connect
 from models import Campaign, Template, User
 
 # Initialize colorama
@@ -18,16 +17,8 @@ async def verify_system():
         return
     
     try:
-        client = AsyncIOMotorClient(
-            MONGO_URI,
-            tls=True,
-            tlsAllowInvalidCertificates=True,
-            serverSelectionTimeoutMS=5000
-        )
-        await client.admin.command('ping')
+        await connect([Campaign, Template, User])
         print(f"{Fore.GREEN}✅ Connected to MongoDB.{Style.RESET_ALL}\n")
-        
-        await init_beanie(database=client.whatsapp_dashboard, document_models=[Campaign, Template, User])
     except Exception as e:
         print(f"{Fore.RED}❌ Database Connection Failed: {e}{Style.RESET_ALL}")
         return
@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Runs against a scratch database, dropped at the end; never the app's own
+VERIFY_DB = os.getenv("VERIFY_MONGO_DB", "whatsapp_dashboard_verify_sheets")
+os.environ["MONGO_DB"] = VERIFY_DB
+
+from database import connect, get_database, MONGO_DB
+from models import Campaign, Contact, Message, SheetImport, SheetImportRow
+from sheet_fetch import FETCHED, NOT_MODIFIED, UNCHANGED
+from sheet_import import run_sheet_import, run_sheet_batch, diff_summary
+
+# End-to-end check of the sheet import pipeline: a first import, a 304, an
+# unchanged content hash, changed/removed rows and a batch of overlapping
+# sheets. Remote exports are served by a local http.server stand-in that
+# honours If-None-Match, local ones are plain temp CSV files.
+#
+#   MONGO_URI=... python verify_sheet_import.py
+
+class Colors:
+    OKGREEN = '\033[92m'
+    FAIL = '\033[91m'
+    OKBLUE = '\033[94m'
+    ENDC = '\033[0m'
+    BOLD = '\033[1m'
+
+def print_pass(msg):
+    print(f"{Colors.OKGREEN}✅ PASS:{Colors.ENDC} {msg}")
+
+def print_fail(msg, details=""):
+    print(f"{Colors.FAIL}❌ FAIL:{Colors.ENDC} {msg}")
+    if details:
+        print(f"   Details: {details}")
+    raise SystemExit(1)
+
+def print_section(title):
+    print(f"\n{Colors.OKBLUE}{Colors.BOLD}=== {title} ==={Colors.ENDC}")
+
+def check(label, actual, expected):
+    if actual != expected:
+        print_fail(label, f"expected {expected!r}, got {actual!r}")
+    print_pass(label)
+
+# --- Sheet Stand-in ---
+
+SHEETS = {} # path -> CSV text served by the stand-in
+
+class SheetHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = SHEETS.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = body.encode()
+        etag = '"' + hashlib.sha256(data).hexdigest()[:16] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+def start_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SheetHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+async def new_import(name: str, url: str) -> SheetImport:
+    sheet_import = SheetImport(name=name, sheet_url=url, sheet_id=name)
+    await sheet_import.insert()
+    return sheet_import
+
+async def contact_tags(phone: str):
+    contact = await Contact.find_one(Contact.phone == phone)
+    return sorted(contact.tags) if contact else None
+
+# --- Scenarios ---
+
+async def verify_remote(base_url: str):
+    print_section("1. First Import (http)")
+    SHEETS["/people.csv"] = (
+        "Name,Phone,Tags\n"
+        "Alice,+15550001,\"vip,new\"\n"
+        "Bob,+15550002,\n"
+        "Alice again,+15550001,\n" # Duplicate phone
+        "Nobody,not a phone,\n" # Invalid
+        "Carol,+15550003,\n"
+    )
+    sheet = await new_import("people", f"{base_url}/people.csv")
+    await run_sheet_import(sheet)
+    check("status completed", sheet.status, "completed")
+    check("fetched", sheet.last_fetch_status, FETCHED)
+    check("diff", diff_summary(sheet), {"added": 3, "changed": 0, "unchanged": 0, "removed": 0, "invalid": 1, "duplicates": 1})
+    check("contacts created", sheet.contacts_created, 3)
+    check("row records", await SheetImportRow.find(SheetImportRow.import_id == str(sheet.id)).count(), 3)
+    check("ETag stored", bool(sheet.etag), True)
+
+    print_section("2. Re-sync, Export Not Modified (304)")
+    await run_sheet_import(sheet)
+    check("not modified", sheet.last_fetch_status, NOT_MODIFIED)
+    check("diff", diff_summary(sheet), {"added": 0, "changed": 0, "unchanged": 3, "removed": 0, "invalid": 1, "duplicates": 1})
+    check("rows processed", sheet.rows_processed, 5)
+
+    print_section("3. Changed and Removed Rows")
+    SHEETS["/people.csv"] = (
+        "Name,Phone,Tags\n"
+        "Alice,+15550001,vip\n" # Lost a tag
+        "Carol,+15550003,\n"
+        "Dave,+15550004,\n" # New; Bob is gone
+    )
+    await run_sheet_import(sheet, delete_removed=True)
+    check("fetched", sheet.last_fetch_status, FETCHED)
+    check("diff", diff_summary(sheet), {"added": 1, "changed": 1, "unchanged": 1, "removed": 1, "invalid": 0, "duplicates": 0})
+    check("dropped tag pulled", await contact_tags("+15550001"), ["vip"])
+    check("removed contact deleted", await Contact.find_one(Contact.phone == "+15550002"), None)
+    return sheet
+
+async def verify_local(workdir: str):
+    print_section("4. Local CSV, Unchanged Content Hash")
+    path = os.path.join(workdir, "local.csv")
+    with open(path, "w") as f:
+        f.write("Name,Phone\nErin,+15550005\nFrank,+15550006\n")
+    sheet = await new_import("local", path)
+    await run_sheet_import(sheet)
+    check("first run added", diff_summary(sheet)["added"], 2)
+    await run_sheet_import(sheet)
+    check("unchanged", sheet.last_fetch_status, UNCHANGED)
+    check("diff", diff_summary(sheet), {"added": 0, "changed": 0, "unchanged": 2, "removed": 0, "invalid": 0, "duplicates": 0})
+
+    # force=True skips the cache: parsed again, every row hash matches
+    await run_sheet_import(sheet, force=True)
+    check("forced run fetched", sheet.last_fetch_status, FETCHED)
+    check("forced run all unchanged", diff_summary(sheet)["unchanged"], 2)
+
+async def verify_batch(base_url: str, people: SheetImport):
+    print_section("5. Batch With Overlapping Phones")
+    SHEETS["/east.csv"] = "Name,Phone,Tags\nGina,+15550007,east\nHank,+15550008,east\nAlice,+15550001,east\n"
+    SHEETS["/west.csv"] = "Name,Phone,Tags\nGina,+15550007,west\nIvy,+15550009,west\n"
+    east = await new_import("east", f"{base_url}/east.csv")
+    west = await new_import("west", f"{base_url}/west.csv")
+    summary = await run_sheet_batch([east, west], concurrency=2)
+    check("no failures", summary["failed"], 0)
+    # Gina is in both sheets, Alice already came from `people`: 4 distinct phones, each written once
+    check("contacts written once", summary["contacts_written"], 4)
+    check("overlap skipped by one sheet", east.duplicates_skipped + west.duplicates_skipped, 1)
+    check("one contact per phone", await Contact.find(Contact.phone == "+15550007").count(), 1)
+
+    # Alice is still listed by `east`, so dropping her from `people` must not delete her
+    SHEETS["/people.csv"] = "Name,Phone,Tags\nCarol,+15550003,\nDave,+15550004,\n"
+    await run_sheet_import(people, delete_removed=True)
+    check("removed from one sheet", people.rows_removed, 1)
+    check("contact listed by another sheet kept", await Contact.find_one(Contact.phone == "+15550001") is not None, True)
+
+async def main() -> int:
+    if not os.getenv("MONGO_URI"):
+        print(f"{Colors.FAIL}❌ MONGO_URI not found in environment variables.{Colors.ENDC}")
+        return 2
+    if MONGO_DB != VERIFY_DB:
+        print(f"{Colors.FAIL}❌ Refusing to run against {MONGO_DB}: database was configured before this script.{Colors.ENDC}")
+        return 2
+    db = get_database()
+    try:
+        await db.client.drop_database(MONGO_DB) # Leftovers of an aborted run
+        await connect([Contact, Message, Campaign, SheetImport, SheetImportRow]) # Message/Campaign: purge of deleted contacts
+    except Exception as e:
+        print(f"{Colors.FAIL}❌ Database Connection Failed: {e}{Colors.ENDC}")
+        return 2
+    print(f"{Colors.BOLD}🚀 Sheet import verification (database {MONGO_DB}){Colors.ENDC}")
+
+    server = start_server()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    workdir = tempfile.mkdtemp(prefix="verify-sheets-")
+    try:
+        people = await verify_remote(base_url)
+        await verify_local(workdir)
+        await verify_batch(base_url, people)
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+        await db.client.drop_database(MONGO_DB)
+
+    print(f"\n{Colors.OKGREEN}{Colors.BOLD}🏁 Sheet import verified.{Colors.ENDC}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,22 @@
+from collections import defaultdict
+from typing import Dict
+from models import Contact, Message, Campaign, Template
+from invalidation import invalidation, collection_name
+
+# In-process write counters per collection. Code that writes a collection
+# bumps its counter; caches key their entries by the counter so a local
+# write makes every older entry unreachable at once. Writes made by other
+# workers are not seen here directly: the change stream bumps the counter for
+# those (see invalidation.py), and the caches also carry a TTL.
+_versions: Dict[str, int] = defaultdict(int)
+
+def bump(collection: str) -> int:
+    _versions[collection] += 1
+    return _versions[collection]
+
+def current(collection: str) -> int:
+    return _versions[collection]
+
+# Collection changed anywhere (another worker, a script) -> bump its counter
+for _model, _name in [(Contact, "contacts"), (Message, "messages"), (Campaign, "campaigns"), (Template, "templates")]:
+    invalidation.register(collection_name(_model), lambda doc_id, name=_name: bump(name))